@@ -0,0 +1,140 @@
+# batch_engine.py
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from config import HOUSE_COEFS, REALISM_UPLIFT, get_provider
+from engine import _calculate_volumes_limassol_model, _calculate_volumes_minsk_model, get_compiled_tariffs
+from profiling import STATS
+
+# ======================================================================================
+# ПАКЕТНЫЙ (ВЕКТОРИЗОВАННЫЙ) РАСЧЕТ
+# ======================================================================================
+# Та же логика, что и в engine.py, но для тысяч домохозяйств за один вызов.
+# Входные данные - pandas.DataFrame или словарь массивов NumPy с колонками
+# area_m2, occupants, month и необязательной behavior_factor (по умолчанию 1.0).
+# Все колонки фрейма доступны конвейерам как calculation_params (floor, subsidy_multiplier, ...).
+# Если колонки нет, используются те же значения по умолчанию, что и в скалярном движке.
+#
+# Округление повторяет round(x, 2) скалярного движка, поэтому результаты совпадают с
+# calculate_costs до копейки.
+
+# --- ВЕКТОРИЗОВАННЫЕ СТРАТЕГИИ РАСЧЕТА ОБЪЕМОВ ---
+# Скалярные стратегии engine.py работают и с массивами NumPy; заменяется только
+# проверка отопительного сезона (month in heating_months).
+
+def _batch_heating_season(month, heating_months):
+    return np.isin(month, heating_months)
+
+# --- РЕЕСТР ВЕКТОРИЗОВАННЫХ СТРАТЕГИЙ (ключи совпадают с VOLUME_CALCULATION_STRATEGIES) ---
+BATCH_VOLUME_STRATEGIES = {
+    "standard_minsk": partial(_calculate_volumes_minsk_model, heating_season=_batch_heating_season),
+    "standard_limassol": _calculate_volumes_limassol_model,
+}
+
+# ======================================================================================
+# ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ
+# ======================================================================================
+
+def _frame_length(frame):
+    if isinstance(frame, pd.DataFrame):
+        return len(frame)
+    return len(next(iter(frame.values()))) if frame else 0
+
+def _frame_columns(frame):
+    return {key: np.asarray(frame[key]) for key in frame}
+
+def round_money(values):
+    # Векторный аналог round(x, 2). np.round считает rint(x * 100) / 100 и на значениях
+    # вида N.xx5 расходится с round(), который смотрит на точное двоичное значение x.
+    # Для значений рядом с серединой между копейками x * 100 раскладываем без потерь
+    # на scaled + err (разбиение Векампа/Деккера) и сравниваем точное произведение с серединой.
+    values = np.asarray(values, dtype=float)
+    scaled = values * 100
+    cents = np.rint(scaled)
+    near_half = np.abs(np.abs(scaled - cents) - 0.5) < 1e-6
+    if near_half.any():
+        x = values[near_half]; x_scaled = scaled[near_half]
+        split = x * 134217729.0
+        high = split - (split - x); low = x - high
+        err = (high * 100 - x_scaled) + low * 100
+        lower = np.floor(x_scaled)
+        delta = (x_scaled - (lower + 0.5)) + err
+        cents[near_half] = lower + (delta > 0) + ((delta == 0) & (np.fmod(lower, 2) != 0))
+    return cents / 100
+
+def _money_column(value, n):
+    # Конвейеры с постоянным результатом возвращают скаляр - округляем его один раз
+    if np.ndim(value) == 0:
+        return np.full(n, round(float(value), 2))
+    return round_money(np.broadcast_to(value, (n,)))
+
+# ======================================================================================
+# ПУБЛИЧНОЕ API
+# ======================================================================================
+
+def calculate_volumes_batch(city, frame, provider=None):
+    city_config = (provider or get_provider()).city_config(city)
+    model_name = city_config.get("volume_model", "")
+    strategy_function = BATCH_VOLUME_STRATEGIES.get(model_name)
+    if not strategy_function:
+        return {}
+    if STATS.enabled:
+        strategy_function = STATS.timed("volume_strategy", (f"{model_name} (batch)",), strategy_function)
+    columns = _frame_columns(frame)
+    behavior_factor = columns.get("behavior_factor", 1.0)
+    return strategy_function(columns["area_m2"], columns["occupants"], columns["month"], behavior_factor, city_config)
+
+def calculate_costs_batch(city, frame, volumes=None, provider=None, as_of=None):
+    """Стоимость услуг для каждой строки фрейма: DataFrame с колонкой на услугу и 'Итого'.
+
+    volumes - заранее посчитанные объемы (словарь массивов); если не заданы,
+    они считаются по стратегии города из колонок фрейма. as_of - дата тарифов,
+    как в engine.calculate_costs.
+    """
+    n = _frame_length(frame)
+    calculation_params = _frame_columns(frame)
+    if volumes is None:
+        volumes = calculate_volumes_batch(city, frame, provider)
+
+    costs = {}
+    for service, run in get_compiled_tariffs(city, vectorized=True, provider=provider, as_of=as_of):
+        costs[service] = _money_column(run(volumes, calculation_params), n)
+    total = np.zeros(n)
+    for service, values in costs.items():
+        if service != "Итого": total = total + values
+    costs["Итого"] = round_money(total)
+
+    index = frame.index if isinstance(frame, pd.DataFrame) else None
+    return pd.DataFrame(costs, index=index)
+
+def _house_coef_column(house_category, key):
+    if isinstance(house_category, str):
+        return HOUSE_COEFS.get(house_category, {}).get(key, 1.0)
+    # Коэффициент ищется один раз на категорию; пропуски (None) получают код -1 и 1.0
+    codes, categories = pd.factorize(house_category if isinstance(house_category, pd.Categorical)
+                                     else np.asarray(house_category, dtype=object))
+    coefs = np.array([HOUSE_COEFS.get(category, {}).get(key, 1.0) for category in categories] + [1.0])
+    return coefs[codes]
+
+def apply_neighbor_adjustment_batch(costs, house_category):
+    """Векторный аналог engine.apply_neighbor_adjustment.
+
+    house_category - одна категория для всех строк или массив категорий по строкам.
+    Как и в скалярной версии, округляется только 'Итого'.
+    """
+    elec_coef = _house_coef_column(house_category, "electricity")
+    heat_coef = _house_coef_column(house_category, "heating")
+    final_costs = {}
+    for service in costs.columns:
+        if service == "Итого": continue
+        values = costs[service].to_numpy()
+        if service == "Электроэнергия": values = values * elec_coef
+        if service == "Отопление": values = values * heat_coef
+        final_costs[service] = values * REALISM_UPLIFT
+    total = np.zeros(len(costs))
+    for values in final_costs.values():
+        total = total + values
+    final_costs["Итого"] = round_money(total)
+    return pd.DataFrame(final_costs, index=costs.index)
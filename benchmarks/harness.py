@@ -0,0 +1,97 @@
+# benchmarks/harness.py
+import gc
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+# ======================================================================================
+# ЗАМЕРЫ И СРАВНЕНИЕ С БАЗОВОЙ ЛИНИЕЙ
+# ======================================================================================
+# Каждый замер - это число вызовов, подобранное так, чтобы он длился не меньше
+# min_sample_time: так функции длительностью в доли микросекунды меряются без
+# погрешности таймера. Перцентили считаются по средней длительности вызова в замере.
+# Пиковая память меряется отдельным прогоном под tracemalloc, чтобы не искажать время.
+
+
+def _calibrate(fn, min_sample_time):
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number): fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_sample_time or number >= 1_000_000:
+            return number
+        number *= 2 if elapsed == 0 else max(2, min(10, int(min_sample_time / elapsed) + 1))
+
+def _percentile(sorted_values, q):
+    if len(sorted_values) == 1: return sorted_values[0]
+    pos = (len(sorted_values) - 1) * q
+    low = int(pos); high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (pos - low)
+
+def measure(fn, samples=30, min_sample_time=0.005, setup=None):
+    """Возвращает ops/sec, перцентили времени вызова (мкс) и пиковую память (КиБ)."""
+    if setup is not None: setup()
+    fn()  # прогрев: кэши провайдера, компиляция конвейеров
+    number = _calibrate(fn, min_sample_time)
+
+    gc_was_enabled = gc.isenabled(); gc.disable()
+    try:
+        per_call = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            for _ in range(number): fn()
+            per_call.append((time.perf_counter() - started) / number)
+    finally:
+        if gc_was_enabled: gc.enable()
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    per_call.sort()
+    return {
+        "ops_per_sec": 1.0 / statistics.mean(per_call),
+        "p50_us": _percentile(per_call, 0.50) * 1e6,
+        "p95_us": _percentile(per_call, 0.95) * 1e6,
+        "p99_us": _percentile(per_call, 0.99) * 1e6,
+        "peak_kib": peak / 1024,
+        "calls_per_sample": number,
+        "samples": samples,
+    }
+
+def environment():
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+def save_results(path, results):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"environment": environment(), "results": results}, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+def load_results(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["results"]
+
+def compare(results, baseline, threshold, memory_slack_kib=64.0):
+    """Список регрессий: p50 медленнее базового больше чем на threshold (доля),
+    или пиковая память выросла больше чем на threshold и на memory_slack_kib."""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None: continue
+        if current["p50_us"] > base["p50_us"] * (1 + threshold):
+            regressions.append((name, "p50_us", base["p50_us"], current["p50_us"]))
+        if current["peak_kib"] > base["peak_kib"] * (1 + threshold) + memory_slack_kib:
+            regressions.append((name, "peak_kib", base["peak_kib"], current["peak_kib"]))
+    return regressions
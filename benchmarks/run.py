@@ -0,0 +1,178 @@
+# benchmarks/run.py
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.harness import measure, save_results, load_results, compare
+from benchmarks.synthetic import write_synthetic_db
+from config import HOUSE_COEFS, get_provider
+from config_provider import TariffConfigProvider
+from db_connector import load_config_from_db
+from engine import (VOLUME_CALCULATION_STRATEGIES, _execute_pipeline, calculate_volumes, calculate_costs,
+                    apply_neighbor_adjustment)
+from pipeline_compiler import compile_pipeline
+from batch_engine import calculate_costs_batch
+from neighbor_simulation import simulate_neighbors, neighbor_percentiles
+
+# ======================================================================================
+# НАБОР БЕНЧМАРКОВ ДВИЖКА
+# ======================================================================================
+# Запуск из корня репозитория:
+#   python -m benchmarks.run                                   - замерить и напечатать
+#   python -m benchmarks.run --save benchmarks/baseline.json   - сохранить базовую линию
+#   python -m benchmarks.run --compare benchmarks/baseline.json --threshold 0.25
+#       - код возврата 1, если p50 или пиковая память хуже базовой линии больше чем на 25%
+# Базовая линия зависит от машины, поэтому сохраняйте и сравнивайте ее на одном и том же окружении.
+
+CALCULATION_PARAMS = {"area_m2": 90.0, "occupants": 3, "floor": 5, "subsidy_multiplier": 1.0}
+VOLUMES = {"Электроэнергия": 330.0, "Вода": 13.5, "Канализация": 13.5, "Отопление": 1.93}
+
+# Минимальные конвейеры для каждого оператора (по образцу тарифов из utilities.db)
+OPERATOR_CASES = {
+    "get_volume": ([{"operator": "get_volume", "source": "Вода"}], {}),
+    "get_param": ([{"operator": "get_param", "param_key": "area_m2"}], {}),
+    "get_fixed_amount": ([{"operator": "get_fixed_amount", "param_key": "amount"}], {"amount": 20}),
+    "add_param": ([{"operator": "get_volume", "source": "Вода"}, {"operator": "add_param", "param_key": "base_fee"}],
+                  {"base_fee": 22.0}),
+    "multiply_by_param": ([{"operator": "get_volume", "source": "Вода"}, {"operator": "multiply_by_param", "param_key": "rate"}],
+                          {"rate": 1.7858}),
+    "multiply_by_context": ([{"operator": "get_fixed_amount", "param_key": "rate"},
+                             {"operator": "multiply_by_context", "param_key": "occupants"}], {"rate": 0.88}),
+    "apply_progressive_rate": ([{"operator": "get_volume", "source": "Электроэнергия"},
+                                {"operator": "apply_progressive_rate", "param_key": "brackets"}],
+                               {"brackets": [{"from": 201, "to": 400, "rate": 0.3}, {"from": 1, "to": 200, "rate": 0.2},
+                                             {"from": 401, "rate": 0.45}]}),
+    "apply_conditional_value": ([{"operator": "apply_conditional_value", "check_param": "floor", "condition": "gt",
+                                  "threshold": 1, "value_if_true": "elevator_rate", "value_if_false": "zero"}],
+                                {"elevator_rate": 0.88, "zero": 0}),
+    "sum_of_steps": ([{"operator": "sum_of_steps", "pipelines": [
+                        [{"operator": "get_param", "param_key": "area_m2"}, {"operator": "multiply_by_param", "param_key": "a"}],
+                        [{"operator": "get_param", "param_key": "area_m2"}, {"operator": "multiply_by_param", "param_key": "b"}],
+                        [{"operator": "get_param", "param_key": "occupants"}, {"operator": "multiply_by_param", "param_key": "c"}]]}],
+                     {"a": 0.0388, "b": 0.0249, "c": 0.2092}),
+    "apply_vat": ([{"operator": "get_volume", "source": "Электроэнергия"}, {"operator": "apply_vat"}], {}),
+    "apply_subsidy": ([{"operator": "get_volume", "source": "Электроэнергия"},
+                       {"operator": "apply_subsidy", "params_keys": ["subsidy_rate", "full_rate"]}],
+                      {"subsidy_rate": 0.2412, "full_rate": 0.2969}),
+}
+
+
+def engine_cases():
+    cases = {}
+    provider = get_provider()
+
+    for model_name, strategy in VOLUME_CALCULATION_STRATEGIES.items():
+        config = {"heating_months": [1, 2, 3, 4, 10, 11, 12]}
+        cases[f"volumes/{model_name}"] = lambda s=strategy, c=config: s(90.0, 3, 1, 1.0, c)
+
+    for op, (pipeline, params) in OPERATOR_CASES.items():
+        rule = {"vat": 0.19, "params": params, "pipeline": pipeline}
+        run, _ = compile_pipeline(pipeline, rule)
+        cases[f"pipeline/interpreter/{op}"] = lambda p=pipeline, r=rule: _execute_pipeline(p, r, VOLUMES, CALCULATION_PARAMS)
+        cases[f"pipeline/compiled/{op}"] = lambda r=run: r(VOLUMES, CALCULATION_PARAMS)
+
+    for city in provider.city_names():
+        label = city.strip()
+        volumes = calculate_volumes(city, 90.0, 3, 1, 1.0)
+        cases[f"volumes/city/{label}"] = lambda c=city: calculate_volumes(c, 90.0, 3, 1, 1.0)
+        cases[f"costs/{label}"] = lambda c=city, v=volumes: calculate_costs(c, v, CALCULATION_PARAMS)
+        frame = _household_frame(10_000)
+        cases[f"batch/{label}/10k"] = lambda c=city, f=frame: calculate_costs_batch(c, f)
+        cases[f"neighbor_simulation/{label}/50k"] = lambda c=city: neighbor_percentiles(
+            simulate_neighbors(c, 1, CALCULATION_PARAMS, draws=50_000))
+
+    costs = calculate_costs(provider.city_names()[0], calculate_volumes(provider.city_names()[0], 90.0, 3, 1, 1.0),
+                            CALCULATION_PARAMS)
+    for category in HOUSE_COEFS:
+        cases[f"neighbor_adjustment/{category}"] = lambda c=costs, h=category: apply_neighbor_adjustment(c, h)
+
+    cases["config/load_config_from_db"] = load_config_from_db
+    cases["config/provider_cold_city"] = lambda: TariffConfigProvider().city_config(provider.city_names()[0])
+    return cases
+
+SYNTHETIC_SERVICE_CASES = ("costs", "interpreter", "batch_1k", "load_config")
+
+def synthetic_cases(workdir, service_counts, depth, name_filter=""):
+    # Генерация БД на сотни услуг и тысячу городов дорогая - создаем только те,
+    # чьи бенчмарки проходят --filter
+    def selected(names):
+        return any(name_filter in name for name in names)
+
+    cases = {}
+    for n_services in service_counts:
+        if not selected(f"synthetic/{n_services}/{case}" for case in SYNTHETIC_SERVICE_CASES): continue
+        path = os.path.join(workdir, f"synthetic_{n_services}.db")
+        city = write_synthetic_db(path, n_cities=1, n_services=n_services, depth=depth)[0]
+        provider = TariffConfigProvider(path)
+        volumes = calculate_volumes(city, 90.0, 3, 1, 1.0, provider)
+        tariffs = provider.tariffs(city)
+        cases[f"synthetic/{n_services}/costs"] = lambda c=city, v=volumes, p=provider: calculate_costs(c, v, CALCULATION_PARAMS, p)
+        cases[f"synthetic/{n_services}/interpreter"] = lambda t=tariffs, v=volumes: [
+            _execute_pipeline(rule["pipeline"], rule, v, CALCULATION_PARAMS) for rule in t.values()]
+        cases[f"synthetic/{n_services}/batch_1k"] = (
+            lambda c=city, f=_household_frame(1_000), p=provider: calculate_costs_batch(c, f, provider=p))
+        cases[f"synthetic/{n_services}/load_config"] = lambda p=path: load_config_from_db(p)
+
+    # Много небольших городов: загрузка всей конфигурации провайдером "с нуля"
+    if not selected(["synthetic/cities_1000/provider_load_all"]): return cases
+    path = os.path.join(workdir, "synthetic_cities_1000.db")
+    write_synthetic_db(path, n_cities=1000, n_services=8, depth=1)
+    cases["synthetic/cities_1000/provider_load_all"] = lambda p=path: TariffConfigProvider(p).load_all()
+    return cases
+
+def _household_frame(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "area_m2": rng.uniform(20, 200, n).round(1), "occupants": rng.integers(1, 7, n), "month": rng.integers(1, 13, n),
+        "behavior_factor": rng.choice([0.85, 1.0, 1.25], n), "floor": 5, "subsidy_multiplier": 1.0,
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарки движка расчета")
+    parser.add_argument("--filter", default="", help="запускать только бенчмарки, чье имя содержит подстроку")
+    parser.add_argument("--samples", type=int, default=30)
+    parser.add_argument("--quick", action="store_true", help="меньше замеров, для быстрой проверки")
+    parser.add_argument("--synthetic-services", default="10,100,500")
+    parser.add_argument("--synthetic-depth", type=int, default=3)
+    parser.add_argument("--save", help="сохранить результаты как JSON (базовая линия)")
+    parser.add_argument("--compare", help="сравнить с базовой линией из JSON")
+    parser.add_argument("--threshold", type=float, default=0.25, help="допустимое ухудшение, доля (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    samples = 5 if args.quick else args.samples
+    min_sample_time = 0.002 if args.quick else 0.005
+    service_counts = [int(x) for x in args.synthetic_services.split(",") if x]
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        cases = engine_cases()
+        cases.update(synthetic_cases(workdir, service_counts, args.synthetic_depth, args.filter))
+        print(f"{'бенчмарк':<48} {'ops/s':>12} {'p50, мкс':>11} {'p95, мкс':>11} {'p99, мкс':>11} {'пик, КиБ':>10}")
+        for name, fn in cases.items():
+            if args.filter not in name: continue
+            r = measure(fn, samples=samples, min_sample_time=min_sample_time)
+            results[name] = r
+            print(f"{name:<48} {r['ops_per_sec']:>12,.0f} {r['p50_us']:>11.2f} {r['p95_us']:>11.2f} "
+                  f"{r['p99_us']:>11.2f} {r['peak_kib']:>10.1f}")
+
+    if args.save:
+        save_results(args.save, results)
+        print(f"\nРезультаты сохранены: {args.save}")
+    if args.compare:
+        regressions = compare(results, load_results(args.compare), args.threshold)
+        if regressions:
+            print(f"\nРЕГРЕССИИ (порог {args.threshold:.0%}):")
+            for name, metric, base, current in regressions:
+                print(f"  {name}: {metric} {base:.2f} -> {current:.2f} ({current / base - 1:+.0%})")
+            return 1
+        print(f"\nРегрессий нет (порог {args.threshold:.0%}).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
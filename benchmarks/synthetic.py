@@ -0,0 +1,106 @@
+# benchmarks/synthetic.py
+import contextlib
+import io
+import os
+import random
+import sqlite3
+
+from setup_db import create_schema
+from update_db_schema import migrate
+from bulk_import import import_cities
+
+# ======================================================================================
+# ГЕНЕРАТОР СИНТЕТИЧЕСКИХ ТАРИФОВ
+# ======================================================================================
+# Города с сотнями услуг и глубокими конвейерами (вложенные sum_of_steps), чтобы было
+# видно, как движок масштабируется. Генерация детерминирована при одинаковом seed.
+# Объемы берутся из стратегии standard_minsk, поэтому синтетические города считаются
+# тем же calculate_volumes, что и настоящие.
+
+VOLUME_SOURCES = ["Электроэнергия", "Вода", "Канализация", "Отопление"]
+CONTEXT_PARAMS = ["area_m2", "occupants", "floor"]
+MODIFIERS = ["multiply_by_param", "add_param", "multiply_by_context", "apply_progressive_rate", "apply_subsidy", "apply_vat"]
+
+
+def _new_param(rnd, params, value):
+    key = f"p{len(params)}"
+    params[key] = value
+    return key
+
+def _make_brackets(rnd):
+    brackets, start = [], 0
+    for _ in range(rnd.randint(2, 5)):
+        width = rnd.randint(10, 200)
+        brackets.append({"from": start + 1, "to": start + width, "rate": round(rnd.uniform(0.05, 3.0), 4)})
+        start += width
+    brackets.append({"from": start + 1, "rate": round(rnd.uniform(0.05, 3.0), 4)})
+    rnd.shuffle(brackets)
+    return brackets
+
+def _make_pipeline(rnd, params, depth, fanout):
+    if depth > 0:
+        steps = [{"operator": "sum_of_steps",
+                  "pipelines": [_make_pipeline(rnd, params, depth - 1, fanout) for _ in range(fanout)]}]
+    else:
+        start = rnd.choice(["get_volume", "get_param", "get_fixed_amount", "apply_conditional_value"])
+        if start == "get_volume":
+            steps = [{"operator": "get_volume", "source": rnd.choice(VOLUME_SOURCES)}]
+        elif start == "get_param":
+            steps = [{"operator": "get_param", "param_key": rnd.choice(CONTEXT_PARAMS)}]
+        elif start == "get_fixed_amount":
+            steps = [{"operator": "get_fixed_amount", "param_key": _new_param(rnd, params, rnd.randint(1, 100))}]
+        else:
+            steps = [{"operator": "apply_conditional_value", "check_param": rnd.choice(CONTEXT_PARAMS),
+                      "condition": rnd.choice(["gt", "lt", "eq"]), "threshold": rnd.randint(1, 10),
+                      "value_if_true": _new_param(rnd, params, round(rnd.uniform(0, 5), 2)),
+                      "value_if_false": _new_param(rnd, params, round(rnd.uniform(0, 5), 2))}]
+
+    for modifier in rnd.sample(MODIFIERS, rnd.randint(1, 3)):
+        if modifier in ("multiply_by_param", "add_param"):
+            steps.append({"operator": modifier, "param_key": _new_param(rnd, params, round(rnd.uniform(0.1, 3.0), 4))})
+        elif modifier == "multiply_by_context":
+            steps.append({"operator": modifier, "param_key": rnd.choice(CONTEXT_PARAMS)})
+        elif modifier == "apply_progressive_rate":
+            steps.append({"operator": modifier, "param_key": _new_param(rnd, params, _make_brackets(rnd))})
+        elif modifier == "apply_subsidy":
+            steps.append({"operator": modifier, "params_keys": [_new_param(rnd, params, round(rnd.uniform(0.1, 1), 4)),
+                                                                _new_param(rnd, params, round(rnd.uniform(1, 2), 4))]})
+        else:
+            steps.append({"operator": modifier})
+    return steps
+
+def make_synthetic_tariffs(n_services, depth=2, fanout=3, seed=0):
+    """Словарь {услуга: {'vat', 'params', 'pipeline'}} в формате TARIFFS_DB[город]."""
+    rnd = random.Random(seed)
+    tariffs = {}
+    for i in range(n_services):
+        params = {}
+        pipeline = _make_pipeline(rnd, params, rnd.randint(0, depth), fanout)
+        tariffs[f"Услуга {i:04d}"] = {"vat": rnd.choice([0.0, 0.05, 0.19, 0.23]), "params": params, "pipeline": pipeline}
+    return tariffs
+
+def write_synthetic_db(path, n_cities=1, n_services=100, depth=2, fanout=3, seed=0):
+    """Создает БД со схемой setup_db.py и синтетическими городами 'Синт-000', 'Синт-001', ..."""
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    create_schema(conn.cursor())
+    conn.commit()
+    conn.close()
+    # Сообщения миграций не должны попадать в таблицу результатов бенчмарков
+    with contextlib.redirect_stdout(io.StringIO()):
+        migrate(path)
+
+    cities = {}
+    for c in range(n_cities):
+        cities[f"Синт-{c:03d}"] = {
+            "currency": "XXX", "volume_model": "standard_minsk", "recommendations": {},
+            "heating_months": [1, 2, 3, 4, 10, 11, 12],
+            "tariffs": make_synthetic_tariffs(n_services, depth, fanout, seed + c),
+        }
+    conn = sqlite3.connect(path)
+    try:
+        import_cities(conn, cities)
+    finally:
+        conn.close()
+    return list(cities)
@@ -0,0 +1,223 @@
+# bill_ingest.py
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from config import SCENARIOS, HOUSE_COEFS, get_provider
+from batch_engine import calculate_costs_batch, apply_neighbor_adjustment_batch
+
+# ======================================================================================
+# ПАКЕТНАЯ ЗАГРУЗКА РЕАЛЬНЫХ СЧЕТОВ И СРАВНЕНИЕ С МОДЕЛЬЮ
+# ======================================================================================
+# Файл счетов (CSV или Parquet) читается кусками фиксированного размера, поэтому память
+# не зависит от размера файла. Ожидаемые колонки: city, month, area_m2, occupants,
+# необязательная household_id и по колонке на услугу с фактической суммой
+# (названия как в БД: "Электроэнергия", "Вода", ...). Пустые суммы считаются нулем,
+# как незаполненные поля в streamlit_app.py.
+#
+# Модельные стоимости (идеальный расчет и средний сосед) считаются пакетным движком
+# по группам (город, месяц, площадь, жильцы). Посчитанные группы хранятся в кэше,
+# ограниченном max_groups на город: при переполнении вытесняются группы, дольше всех
+# не встречавшиеся в кусках. Группы ищутся в кэше по 64-битному хэшу ключа.
+#
+# Тарифы берутся на 1-е число месяца счета, если известен год: колонка year в файле
+# или параметр year (--year); иначе - на дату провайдера (сегодня).
+#
+# Счета городов, которых нет в БД, в отчет не попадают: они пишутся в отдельный файл
+# ошибок (по умолчанию <out>.errors.csv) с колонкой error.
+#
+# Пример:
+#   python bill_ingest.py bills.csv --out report.csv --scenario Средний --house-category Средний
+
+GROUP_KEYS = ["month", "area_m2", "occupants"]
+
+
+def iter_bill_chunks(path, chunk_size):
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Для чтения Parquet установите pyarrow или используйте .csv")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+class BillComparator:
+    """Сравнивает счета с моделью, запоминая уже посчитанные группы домохозяйств."""
+
+    def __init__(self, scenario="Средний", house_category="Средний", floor=5, subsidy_multiplier=1.0, provider=None,
+                 max_groups=100_000, year=None):
+        self.provider = provider or get_provider()
+        self.behavior_factor = SCENARIOS[scenario]
+        self.house_category = house_category
+        self.floor = floor
+        self.subsidy_multiplier = subsidy_multiplier
+        self.max_groups = max_groups
+        self.year = year
+        self._modeled = {}  # (город, дата тарифов) -> DataFrame по хэшу ключа группы: ideal::/neighbor:: и номер куска _used
+        self._chunk = 0
+        self.groups_computed = 0
+
+    def _model_groups(self, city, as_of, groups):
+        frame = groups.assign(floor=self.floor, subsidy_multiplier=self.subsidy_multiplier).reset_index(drop=True)
+        ideal = calculate_costs_batch(city, frame.assign(behavior_factor=1.0), provider=self.provider, as_of=as_of)
+        neighbor_base = calculate_costs_batch(city, frame.assign(behavior_factor=self.behavior_factor),
+                                              provider=self.provider, as_of=as_of)
+        neighbor = apply_neighbor_adjustment_batch(neighbor_base, self.house_category)
+        self.groups_computed += len(frame)
+        return pd.concat([ideal.add_prefix("ideal::"), neighbor.add_prefix("neighbor::")], axis=1)
+
+    def _modeled_for(self, city, as_of, bills):
+        """Модельные стоимости для каждой строки bills (в том же порядке и с тем же индексом)."""
+        keys = pd.util.hash_pandas_object(bills[GROUP_KEYS], index=False).to_numpy()
+        unique_keys, first = np.unique(keys, return_index=True)
+        known = self._modeled.get((city, as_of))
+        missing = np.ones(len(unique_keys), dtype=bool) if known is None else ~np.isin(unique_keys, known.index)
+        if known is not None:
+            known.loc[known.index.isin(unique_keys), "_used"] = self._chunk
+        if missing.any():
+            modeled = self._model_groups(city, as_of, bills[GROUP_KEYS].iloc[first[missing]])
+            modeled.index = unique_keys[missing]
+            modeled["_used"] = self._chunk
+            known = modeled if known is None else pd.concat([known, modeled])
+        joined = known.reindex(keys).set_axis(bills.index)
+        if len(known) > self.max_groups:
+            # Вытесняем группы, дольше всех не встречавшиеся (после выборки для текущего куска)
+            known = known.iloc[np.argsort(-known["_used"].to_numpy(), kind="stable")[:self.max_groups]]
+        self._modeled[(city, as_of)] = known
+        return joined
+
+    def compare_chunk(self, bills):
+        """(отчет, отклоненные счета): счета городов, которых нет в БД, - во втором фрейме с колонкой error."""
+        self._chunk += 1
+        bills = bills.copy()
+        known_cities = bills["city"].isin(self.provider.city_names())
+        rejected = bills[~known_cities].assign(error="город не найден в БД")
+        bills = bills[known_cities]
+        bills["month"] = bills["month"].astype(int)
+        bills["area_m2"] = bills["area_m2"].astype(float)
+        bills["occupants"] = bills["occupants"].astype(int)
+        # Дата тарифов 'ГГГГ-ММ-01'; пустая строка - дата провайдера
+        year = bills["year"].astype(int) if "year" in bills else self.year
+        if year is None:
+            as_of = pd.Series("", index=bills.index)
+        else:
+            as_of = (pd.Series(year, index=bills.index).astype(str).str.zfill(4) + "-"
+                     + bills["month"].astype(str).str.zfill(2) + "-01")
+        reports = []
+        for (city, city_as_of), city_bills in bills.groupby([bills["city"], as_of], sort=False):
+            reports.append(self._compare_city(city, city_as_of or None, city_bills))
+        return (pd.concat(reports).loc[bills.index] if reports else pd.DataFrame()), rejected
+
+    def _compare_city(self, city, as_of, bills):
+        city_config = self.provider.city_config(city, as_of)
+        services = list(self.provider.tariffs(city, as_of))
+        joined = self._modeled_for(city, as_of, bills)
+
+        report = pd.DataFrame(index=bills.index)
+        if "household_id" in bills: report["household_id"] = bills["household_id"]
+        report["city"] = city
+        for key in GROUP_KEYS: report[key] = bills[key]
+
+        actual = pd.DataFrame({s: pd.to_numeric(bills[s], errors="coerce") if s in bills else 0.0 for s in services},
+                              index=bills.index).fillna(0.0)
+        ideal = joined[[f"ideal::{s}" for s in services]].to_numpy()
+        neighbor = joined[[f"neighbor::{s}" for s in services]].to_numpy()
+        over_ideal = actual.to_numpy() - ideal
+
+        report["actual_total"] = actual.sum(axis=1).round(2)
+        report["ideal_total"] = joined["ideal::Итого"]
+        report["neighbor_total"] = joined["neighbor::Итого"]
+        report["overspend_vs_ideal"] = (report["actual_total"] - report["ideal_total"]).round(2)
+        report["overspend_vs_ideal_pct"] = np.where(report["ideal_total"] > 0,
+                                                    (report["overspend_vs_ideal"] / report["ideal_total"] * 100).round(1),
+                                                    np.nan)
+        report["overspend_vs_neighbor"] = (report["actual_total"] - report["neighbor_total"]).round(2)
+        for i, service in enumerate(services):
+            report[f"overspend::{service}"] = over_ideal[:, i].round(2)
+
+        # Рекомендация - по категории с наибольшим перерасходом среди тех, для которых
+        # в городе есть совет; перерасходом, как и в дашборде, считается разница больше 1.
+        recommendations = city_config.get("recommendations", {})
+        categories = [c for c in recommendations if c in services]
+        category, tip = np.full(len(bills), "", dtype=object), np.full(len(bills), "", dtype=object)
+        if categories:
+            diffs = over_ideal[:, [services.index(c) for c in categories]]
+            worst = diffs.argmax(axis=1)
+            has_overspend = diffs[np.arange(len(bills)), worst] > 1
+            names = np.array(categories, dtype=object)[worst]
+            tips = np.array([recommendations[c][1] for c in categories], dtype=object)[worst]
+            category = np.where(has_overspend, names, "")
+            tip = np.where(has_overspend, tips, "")
+        report["recommendation_category"] = category
+        report["recommendation"] = tip
+        return report
+
+
+def ingest_bills(path, out_path, chunk_size=100_000, progress=True, errors_path=None, **comparator_options):
+    comparator = BillComparator(**comparator_options)
+    errors_path = errors_path or f"{out_path}.errors.csv"
+    started = time.perf_counter(); rows = 0; rejected_rows = 0
+    # Набор колонок отчета зависит от услуг городов; фиксируем его по всем городам БД,
+    # чтобы куски с разными городами писались в один CSV с общим заголовком.
+    provider = comparator.provider
+    all_services = []
+    for city in provider.city_names():
+        all_services += [s for s in provider.tariffs(city) if s not in all_services]
+    # Услуги, действующие только в других периодах, - в конец
+    all_services += [s for s in provider.service_names() if s not in all_services]
+    columns, errors = None, None
+    try:
+        with open(out_path, "w", encoding="utf-8", newline="") as out:
+            for chunk in iter_bill_chunks(path, chunk_size):
+                report, rejected = comparator.compare_chunk(chunk)
+                if columns is None and len(report):
+                    head = [c for c in report.columns if not c.startswith("overspend::") and not c.startswith("recommendation")]
+                    columns = head + [f"overspend::{s}" for s in all_services] + ["recommendation_category", "recommendation"]
+                    out.write(",".join(columns) + "\n")
+                if len(report):
+                    report.reindex(columns=columns).to_csv(out, header=False, index=False)
+                if len(rejected):
+                    # Файл ошибок создается только при первом отклоненном счете
+                    if errors is None: errors = open(errors_path, "w", encoding="utf-8", newline="")
+                    rejected.to_csv(errors, header=not rejected_rows, index=False)
+                    rejected_rows += len(rejected)
+                rows += len(chunk)
+                if progress:
+                    elapsed = time.perf_counter() - started
+                    print(f"\r{rows} счетов, {comparator.groups_computed} групп посчитано, {rows / elapsed:,.0f} счетов/с",
+                          end="", file=sys.stderr, flush=True)
+    finally:
+        if errors is not None: errors.close()
+    if progress:
+        print(f"\nГотово: {rows} счетов -> {out_path}", file=sys.stderr)
+        if rejected_rows:
+            print(f"Отклонено (город не найден в БД): {rejected_rows} -> {errors_path}", file=sys.stderr)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сравнение реальных счетов с модельными расходами")
+    parser.add_argument("bills", help="файл счетов (.csv или .parquet)")
+    parser.add_argument("--out", required=True, help="CSV с метриками перерасхода")
+    parser.add_argument("--chunk-size", type=int, default=100_000)
+    parser.add_argument("--scenario", default="Средний", choices=list(SCENARIOS))
+    parser.add_argument("--house-category", default="Средний", choices=list(HOUSE_COEFS))
+    parser.add_argument("--floor", type=int, default=5)
+    parser.add_argument("--subsidy-multiplier", type=float, default=1.0)
+    parser.add_argument("--max-groups", type=int, default=100_000, help="предел кэша посчитанных групп на город")
+    parser.add_argument("--year", type=int, help="год счетов без колонки year: тарифы на 1-е число месяца счета")
+    parser.add_argument("--errors", help="CSV для счетов неизвестных городов (по умолчанию <out>.errors.csv)")
+    args = parser.parse_args(argv)
+    ingest_bills(args.bills, args.out, chunk_size=args.chunk_size, errors_path=args.errors, scenario=args.scenario,
+                 house_category=args.house_category, floor=args.floor, subsidy_multiplier=args.subsidy_multiplier,
+                 max_groups=args.max_groups, year=args.year)
+
+
+if __name__ == "__main__":
+    main()
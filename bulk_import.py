@@ -0,0 +1,93 @@
+# bulk_import.py
+import argparse
+import json
+import sqlite3
+import sys
+import time
+
+from db_connector import DB_FILE, check_schema
+
+# ======================================================================================
+# ПАКЕТНЫЙ ИМПОРТ ГОРОДОВ И ТАРИФОВ
+# ======================================================================================
+# Загружает сотни городов одной транзакцией: каждая таблица заполняется одним
+# executemany, идентификаторы услуг, городов и конвейеров берутся одним SELECT.
+# При ошибке не записывается ничего.
+#
+# Формат - словарь {город: настройки} (его же принимает import_cities):
+#   {"Минск": {"currency": "BYN", "volume_model": "standard_minsk",
+#              "recommendations": {...}, "heating_months": [1, 2, 3],
+#              "tariffs": {"Вода": {"vat": 0.0, "params": {...}, "pipeline": [...]},
+#                          "Электроэнергия": [{..., "valid_to": "2025-01-01"},
+#                                             {..., "valid_from": "2025-01-01"}]}}}
+# Тариф услуги - словарь или список периодов (valid_from/valid_to, 'ГГГГ-ММ-ДД').
+# По умолчанию тарифы импортируемых городов заменяются целиком (--append - дописать).
+#
+#   python bulk_import.py cities.json [--db utilities.db] [--append]
+
+
+def _periods(rules):
+    return rules if isinstance(rules, list) else [rules]
+
+
+def import_cities(conn, cities, replace=True):
+    """Импортирует города в открытое соединение одной транзакцией; возвращает число тарифов."""
+    services = []
+    for config in cities.values():
+        services += [s for s in config.get("tariffs", {}) if s not in services]
+    pipelines = {}
+    for config in cities.values():
+        for rules in config.get("tariffs", {}).values():
+            for rule in _periods(rules):
+                # json.dumps по умолчанию - тот же формат, что у миграции: одинаковые конвейеры совпадут
+                pipelines.setdefault(json.dumps(rule.get("pipeline", [])), None)
+
+    with conn:
+        conn.executemany("INSERT OR IGNORE INTO services (name) VALUES (?)", [(s,) for s in services])
+        conn.executemany(
+            "INSERT INTO cities (name, currency, volume_model, recommendations, heating_months) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET currency = excluded.currency, volume_model = excluded.volume_model, "
+            "recommendations = excluded.recommendations, heating_months = excluded.heating_months",
+            [(name, config.get("currency"), config.get("volume_model"), json.dumps(config.get("recommendations", {})),
+              json.dumps(config.get("heating_months", []))) for name, config in cities.items()])
+        conn.executemany("INSERT OR IGNORE INTO pipelines (definition) VALUES (?)", [(p,) for p in pipelines])
+
+        city_ids = dict(conn.execute("SELECT name, id FROM cities"))
+        service_ids = dict(conn.execute("SELECT name, id FROM services"))
+        pipeline_ids = dict(conn.execute("SELECT definition, id FROM pipelines"))
+        if replace:
+            conn.executemany("DELETE FROM tariffs WHERE city_id = ?", [(city_ids[name],) for name in cities])
+
+        rows = []
+        for name, config in cities.items():
+            for service, rules in config.get("tariffs", {}).items():
+                for rule in _periods(rules):
+                    rows.append((city_ids[name], service_ids[service], rule.get("vat", 0.0), json.dumps(rule.get("params", {})),
+                                 pipeline_ids[json.dumps(rule.get("pipeline", []))], rule.get("valid_from"), rule.get("valid_to")))
+        conn.executemany("INSERT INTO tariffs (city_id, service_id, vat, params, pipeline_id, valid_from, valid_to) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    return len(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетный импорт городов и тарифов в БД")
+    parser.add_argument("source", help="JSON-файл {город: настройки}")
+    parser.add_argument("--db", default=DB_FILE)
+    parser.add_argument("--append", action="store_true", help="не удалять существующие тарифы импортируемых городов")
+    args = parser.parse_args(argv)
+
+    with open(args.source, encoding="utf-8") as f:
+        cities = json.load(f)
+    conn = sqlite3.connect(args.db)
+    try:
+        check_schema(conn, args.db)
+        started = time.perf_counter()
+        count = import_cities(conn, cities, replace=not args.append)
+    finally:
+        conn.close()
+    print(f"Импортировано городов: {len(cities)}, тарифов: {count} за {time.perf_counter() - started:.3f} с",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
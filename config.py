@@ -5,16 +5,47 @@ SCENARIOS = {"Экономный": 0.85, "Средний": 1.0, "Расточи
 HOUSE_COEFS = {"Новый": {"heating": 1.0, "electricity": 1.0}, "Средний": {"heating": 1.05, "electricity": 1.05}, "Старый": {"heating": 1.1, "electricity": 1.05}}
 REALISM_UPLIFT = 1.07
 
+# Распределения параметров соседей для моделирования (neighbor_simulation.py).
+# Виды: fixed (value), uniform (low, high), normal (mean, std), lognormal (median, sigma),
+# choice (values, weights); у числовых видов необязательные границы low/high.
+NEIGHBOR_DISTRIBUTIONS = {
+    "behavior_factor": {"kind": "lognormal", "median": 1.0, "sigma": 0.15, "low": 0.5, "high": 2.0},
+    "occupants": {"kind": "choice", "values": [1, 2, 3, 4, 5, 6], "weights": [0.2, 0.3, 0.25, 0.15, 0.07, 0.03]},
+    "area_m2": {"kind": "lognormal", "median": 60.0, "sigma": 0.35, "low": 20.0, "high": 250.0},
+    "house_category": {"kind": "choice", "values": ["Новый", "Средний", "Старый"], "weights": [0.25, 0.5, 0.25]},
+}
 
-# 2. Импортируем и вызываем наш загрузчик из БД
-from db_connector import load_config_from_db
-
-try:
-    # Главное действие: загружаем конфигурацию из базы данных
-    CITIES_DB, TARIFFS_DB = load_config_from_db()
-except Exception as e:
-    # Если БД не найдена или произошла ошибка, создаем пустые словари,
-    # чтобы приложение не "упало" при запуске.
-    print(f"ОШИБКА: Не удалось загрузить конфигурацию из БД. {e}")
-    print("Убедитесь, что вы создали и заполнили базу данных 'utilities.db'.")
-    CITIES_DB, TARIFFS_DB = {}, {}
+
+# 2. Конфигурация из БД загружается лениво через провайдер (см. config_provider.py).
+# Импорт config больше не открывает SQLite: город читается при первом обращении,
+# а изменения тарифов в БД подхватываются без перезапуска процесса.
+from config_provider import TariffConfigProvider
+
+_default_provider = None
+
+def get_provider():
+    global _default_provider
+    if _default_provider is None:
+        _default_provider = TariffConfigProvider()
+    return _default_provider
+
+def set_provider(provider):
+    global _default_provider
+    _default_provider = provider
+
+
+# 3. Обратная совместимость: CITIES_DB и TARIFFS_DB по-прежнему доступны как атрибуты
+# модуля, но собираются при первом обращении. Это снимок на момент обращения -
+# для горячей перезагрузки используйте get_provider().
+def __getattr__(name):
+    if name not in ("CITIES_DB", "TARIFFS_DB"):
+        raise AttributeError(f"module 'config' has no attribute '{name}'")
+    try:
+        cities_db, tariffs_db = get_provider().load_all()
+    except Exception as e:
+        # Если БД не найдена или произошла ошибка, отдаем пустые словари,
+        # чтобы приложение не "упало" при запуске.
+        print(f"ОШИБКА: Не удалось загрузить конфигурацию из БД. {e}")
+        print("Убедитесь, что вы создали и заполнили базу данных 'utilities.db'.")
+        cities_db, tariffs_db = {}, {}
+    return cities_db if name == "CITIES_DB" else tariffs_db
@@ -0,0 +1,181 @@
+# config_provider.py
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import date
+
+from db_connector import (DB_FILE, connect, fetch_city_names, fetch_city_rows, fetch_all_city_rows, fetch_service_names,
+                          parse_city_rows)
+from pipeline_compiler import compile_tariffs
+from profiling import STATS
+
+# ======================================================================================
+# ЛЕНИВЫЙ ПРОВАЙДЕР КОНФИГУРАЦИИ ТАРИФОВ
+# ======================================================================================
+# Вместо загрузки всей БД при импорте config.py провайдер читает город при первом
+# обращении и кэширует разобранную конфигурацию и скомпилированные конвейеры.
+# Изменения в БД обнаруживаются дешево: os.stat файла (подмена/перезапись) и
+# PRAGMA data_version (коммиты других соединений, в том числе в режиме WAL).
+# Проверка выполняется не чаще раза в check_interval секунд. После изменения город
+# перечитывается при следующем обращении, а JSON разбирается и конвейеры
+# компилируются заново только если строки этого города действительно поменялись.
+#
+# Тарифы выбираются на дату as_of провайдера (по умолчанию - сегодня, см. valid_from/valid_to
+# в update_db_schema.py); смена дня считается изменением, как и правка БД. Методы
+# city_config/tariffs/tariff_version/compiled_tariffs принимают и свою дату as_of
+# (date или 'ГГГГ-ММ-ДД') - для расчета прошлых месяцев; кэши ведутся по (город, дата).
+# Одинаковые тексты конвейеров и params разбираются один раз и разделяют объект -
+# как и раньше, полученную конфигурацию нельзя менять на месте.
+
+
+class TariffConfigProvider:
+    def __init__(self, db_file=DB_FILE, check_interval=1.0, as_of=None):
+        self.db_file = db_file
+        self.check_interval = check_interval
+        self.as_of = as_of
+        self._lock = threading.RLock()
+        self._conn = None
+        self._file_id = None
+        self._state = None
+        self._last_check = None
+        self._city_names = None
+        self._cities = {}      # (город, дата) -> (сырые строки, city_config, tariffs, версия тарифов или None)
+        self._stale = set()    # ключи _cities, которые нужно сверить с БД при следующем обращении
+        self._compiled = {}    # (город, дата, vectorized, profiled) -> скомпилированные конвейеры
+        self._snapshot = None  # (CITIES_DB, TARIFFS_DB) для старого API
+        self._parsed = {}      # текст JSON -> разобранный объект
+        self._date = None
+
+    # --- ОБНАРУЖЕНИЕ ИЗМЕНЕНИЙ ---
+
+    def refresh(self, force=False):
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._last_check is not None and now - self._last_check < self.check_interval:
+                return
+            self._last_check = now
+
+            stat = os.stat(self.db_file)
+            file_id = (stat.st_dev, stat.st_ino)
+            if self._conn is None or file_id != self._file_id:
+                # Файл БД подменили (например, setup_db.py пересоздал его) - переподключаемся
+                if self._conn is not None: self._conn.close()
+                self._conn = connect(self.db_file)
+                self._file_id = file_id
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            self._date = self.as_of or date.today().isoformat()
+            state = (file_id, stat.st_mtime_ns, stat.st_size, data_version, self._date)
+            if state != self._state:
+                if self._state is not None:
+                    self._stale.update(self._cities)
+                self._city_names = None
+                self._snapshot = None
+                self._parsed.clear()
+                self._state = state
+
+    def _loads(self, text):
+        value = self._parsed.get(text)
+        if value is None:
+            value = json.loads(text)
+            self._parsed[text] = value
+        return value
+
+    def _key(self, city, as_of):
+        if isinstance(as_of, date): as_of = as_of.isoformat()
+        return city, as_of or self._date
+
+    def _load_city(self, city, as_of=None):
+        self.refresh()
+        key = self._key(city, as_of)
+        entry = self._cities.get(key)
+        if entry is not None and key not in self._stale:
+            return entry
+        with STATS.measure("config_load", ("provider", city)):
+            return self._store_city(key, fetch_city_rows(self._conn, city, key[1]))
+
+    def _store_city(self, key, rows):
+        self._stale.discard(key)
+        entry = self._cities.get(key)
+        if entry is not None and entry[0] == rows:
+            return entry
+        # Версия тарифов считается при первом запросе (tariff_version)
+        if rows[0] is None:
+            entry = (rows, {}, {}, None)
+        else:
+            # Даты внутри одного периода тарифов получают общую разобранную конфигурацию
+            same = None if key[1] == self._date else next(
+                (e for k, e in self._cities.items() if k[0] == key[0] and e[0] == rows), None)
+            entry = same or (rows,) + parse_city_rows(*rows, loads=self._loads) + (None,)
+        self._cities[key] = entry
+        for compiled_key in [k for k in self._compiled if k[:2] == key]:
+            del self._compiled[compiled_key]
+        if key[1] == self._date: self._snapshot = None
+        return entry
+
+    # --- ПУБЛИЧНОЕ API ---
+
+    def city_names(self):
+        with self._lock:
+            self.refresh()
+            if self._city_names is None:
+                self._city_names = fetch_city_names(self._conn)
+            return list(self._city_names)
+
+    def service_names(self):
+        """Все услуги БД, включая те, что действуют только в прошлых или будущих периодах."""
+        with self._lock:
+            self.refresh()
+            return fetch_service_names(self._conn)
+
+    def city_config(self, city, as_of=None):
+        with self._lock:
+            return self._load_city(city, as_of)[1]
+
+    def tariffs(self, city, as_of=None):
+        with self._lock:
+            return self._load_city(city, as_of)[2]
+
+    def tariff_version(self, city, as_of=None):
+        with self._lock:
+            entry = self._load_city(city, as_of)
+            if entry[3] is None:
+                # Версия - хэш сырых строк города и его тарифов: меняется при любой правке params/pipeline/vat
+                entry = entry[:3] + (hashlib.sha256(repr(entry[0]).encode("utf-8")).hexdigest()[:16],)
+                self._cities[self._key(city, as_of)] = entry
+            return entry[3]
+
+    def compiled_tariffs(self, city, vectorized=False, profiled=False, as_of=None):
+        # profiled=True - вариант с замером каждого шага (profiling.STATS), кэшируется отдельно
+        with self._lock:
+            city_tariffs = self._load_city(city, as_of)[2]
+            key = self._key(city, as_of) + (vectorized, profiled)
+            compiled = self._compiled.get(key)
+            if compiled is None:
+                compiled = compile_tariffs(city_tariffs, vectorized, STATS if profiled else None, city)
+                self._compiled[key] = compiled
+            return compiled
+
+    def load_all(self):
+        """(CITIES_DB, TARIFFS_DB) в формате db_connector.load_config_from_db."""
+        with self._lock:
+            self.refresh()
+            if self._snapshot is None:
+                # Все города двумя запросами вместо пары запросов на город
+                cities_db, tariffs_db = {}, {}
+                with STATS.measure("config_load", ("provider", "")):
+                    all_rows = fetch_all_city_rows(self._conn, self._date)
+                    for city, rows in all_rows.items():
+                        _, city_config, city_tariffs, _ = self._store_city((city, self._date), rows)
+                        cities_db[city] = city_config
+                        if city_tariffs: tariffs_db[city] = city_tariffs
+                self._city_names = list(all_rows)
+                self._snapshot = (cities_db, tariffs_db)
+            return self._snapshot
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
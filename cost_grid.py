@@ -0,0 +1,163 @@
+# cost_grid.py
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from config import SCENARIOS, get_provider
+from engine import ENGINE_CODE_VERSION, apply_neighbor_adjustment
+from batch_engine import calculate_costs_batch
+
+# ======================================================================================
+# ПРЕДРАССЧИТАННЫЕ СЕТКИ СТОИМОСТИ ДЛЯ ДАШБОРДА
+# ======================================================================================
+# Для каждого города заранее считаем стоимость по сетке
+# месяц × жильцы × площадь × сценарий × льгота и храним ее в grids/<город>.npz.
+# Категория дома в сетку не входит: apply_neighbor_adjustment - дешевое умножение,
+# его выполняем при запросе, и результат в узлах сетки совпадает с живым расчетом.
+# Между узлами площади значения интерполируются линейно.
+# Сетка считается устаревшей, если изменились тарифы, настройки города, оси сетки
+# или код формул объемов (engine.ENGINE_CODE_VERSION):
+# тогда lookup_costs возвращает None, и приложение считает через движок.
+
+_BASEDIR = os.path.dirname(__file__)
+GRID_DIR = os.path.join(_BASEDIR, "grids")
+GRID_FORMAT_VERSION = 1
+
+# Оси сетки повторяют диапазоны виджетов в streamlit_app.py
+MONTHS = np.arange(1, 13)
+OCCUPANTS = np.arange(1, 21)
+AREA_BINS = np.arange(10.0, 500.0 + 5.0, 5.0)
+SUBSIDY_MULTIPLIERS = np.array([1.0, 0.0])
+FLOOR = 5
+
+
+_FINGERPRINTS = {}
+
+def grid_fingerprint(city):
+    provider = get_provider()
+    city_config, city_tariffs = provider.city_config(city), provider.tariffs(city)
+    # Провайдер отдает те же объекты, пока данные города не менялись - пересчитываем хэш только после изменений
+    cached = _FINGERPRINTS.get(city)
+    if cached is not None and cached[0] is city_config and cached[1] is city_tariffs:
+        return cached[2]
+    payload = {
+        "version": GRID_FORMAT_VERSION,
+        "engine": ENGINE_CODE_VERSION,
+        "city": city_config,
+        "tariffs": city_tariffs,
+        "scenarios": SCENARIOS,
+        "axes": [MONTHS.tolist(), OCCUPANTS.tolist(), AREA_BINS.tolist(), SUBSIDY_MULTIPLIERS.tolist(), FLOOR],
+    }
+    fingerprint = hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+    _FINGERPRINTS[city] = (city_config, city_tariffs, fingerprint)
+    return fingerprint
+
+def grid_path(city):
+    # Названия городов в БД могут содержать '<' и переводы строк - в имени файла используем хэш
+    return os.path.join(GRID_DIR, hashlib.sha1(city.encode("utf-8")).hexdigest()[:16] + ".npz")
+
+# ======================================================================================
+# ПОСТРОЕНИЕ СЕТКИ
+# ======================================================================================
+
+def _grid_costs(city, behavior_factors):
+    # Все комбинации осей одной таблицей для пакетного движка; порядок осей
+    # (месяц, жильцы, площадь, сценарий, льгота) совпадает с reshape ниже.
+    axes = np.meshgrid(MONTHS, OCCUPANTS, AREA_BINS, behavior_factors, SUBSIDY_MULTIPLIERS, indexing="ij")
+    month, occupants, area_m2, behavior_factor, subsidy_multiplier = (a.ravel() for a in axes)
+    frame = pd.DataFrame({
+        "area_m2": area_m2, "occupants": occupants, "floor": FLOOR, "subsidy_multiplier": subsidy_multiplier,
+        "month": month, "behavior_factor": behavior_factor,
+    })
+    costs = calculate_costs_batch(city, frame)
+    shape = tuple(len(a) for a in (MONTHS, OCCUPANTS, AREA_BINS, behavior_factors, SUBSIDY_MULTIPLIERS))
+    return list(costs.columns), costs.to_numpy().reshape(shape + (len(costs.columns),))
+
+def build_city_grid(city):
+    scenario_names = list(SCENARIOS.keys())
+    services, ideal = _grid_costs(city, np.array([1.0]))
+    _, neighbor = _grid_costs(city, np.array([SCENARIOS[s] for s in scenario_names]))
+    return {
+        "fingerprint": np.array(grid_fingerprint(city)),
+        "services": np.array(services),
+        "scenarios": np.array(scenario_names),
+        "area_bins": AREA_BINS,
+        "ideal": ideal[:, :, :, 0, :, :],
+        "neighbor_base": neighbor,
+    }
+
+def save_city_grid(city, path=None):
+    path = path or grid_path(city)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.savez_compressed(path, **build_city_grid(city))
+    return path
+
+# ======================================================================================
+# ЗАПРОСЫ К СЕТКЕ
+# ======================================================================================
+
+_LOADED_GRIDS = {}
+
+def load_city_grid(city):
+    """Загружает сетку города (с кэшем в памяти процесса); None, если ее нет или она устарела."""
+    path = grid_path(city)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _LOADED_GRIDS.get(city)
+    if cached is None or cached[0] != mtime:
+        with np.load(path) as data:
+            grid = {key: data[key] for key in data.files}
+        cached = (mtime, grid)
+        _LOADED_GRIDS[city] = cached
+    grid = cached[1]
+    if str(grid["fingerprint"]) != grid_fingerprint(city):
+        return None
+    return grid
+
+def _interpolate_row(values, area_bins, area_m2):
+    # values - массив с осью площади первой; в узле сетки значения возвращаются как есть
+    idx = int(np.searchsorted(area_bins, area_m2, side="right")) - 1
+    idx = min(max(idx, 0), len(area_bins) - 2)
+    t = (area_m2 - area_bins[idx]) / (area_bins[idx + 1] - area_bins[idx])
+    if t == 0: return values[idx], True
+    if t == 1: return values[idx + 1], True
+    return values[idx] * (1 - t) + values[idx + 1] * t, False
+
+def _row_to_costs(services, row, exact):
+    if exact:
+        return {service: float(value) for service, value in zip(services, row)}
+    costs = {service: round(float(value), 2) for service, value in zip(services, row) if service != "Итого"}
+    costs["Итого"] = round(sum(costs.values()), 2)
+    return costs
+
+def lookup_costs(city, area_m2, occupants, month, scenario, house_category, subsidy_multiplier):
+    """(ideal_costs, neighbor_costs) из сетки или None, если сетки нет или параметры вне ее."""
+    grid = load_city_grid(city)
+    if grid is None: return None
+    area_bins = grid["area_bins"]
+    scenarios = grid["scenarios"].tolist()
+    if not (area_bins[0] <= area_m2 <= area_bins[-1]) or scenario not in scenarios: return None
+    if occupants != int(occupants) or not (OCCUPANTS[0] <= occupants <= OCCUPANTS[-1]): return None
+    if month not in MONTHS or subsidy_multiplier not in SUBSIDY_MULTIPLIERS: return None
+
+    m = int(month) - 1
+    o = int(occupants) - OCCUPANTS[0]
+    s = int(np.flatnonzero(SUBSIDY_MULTIPLIERS == subsidy_multiplier)[0])
+    services = grid["services"].tolist()
+
+    ideal_row, exact = _interpolate_row(grid["ideal"][m, o, :, s, :], area_bins, area_m2)
+    neighbor_row, _ = _interpolate_row(grid["neighbor_base"][m, o, :, scenarios.index(scenario), s, :], area_bins, area_m2)
+    ideal_costs = _row_to_costs(services, ideal_row, exact)
+    neighbor_costs = apply_neighbor_adjustment(_row_to_costs(services, neighbor_row, exact), house_category)
+    return ideal_costs, neighbor_costs
+
+
+if __name__ == "__main__":
+    for city_name in sys.argv[1:] or get_provider().city_names():
+        print(f"Сетка для '{city_name.strip()}' сохранена: {save_city_grid(city_name)}")
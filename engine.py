@@ -1,18 +1,30 @@
 # engine.py
-from config import TARIFFS_DB, HOUSE_COEFS, REALISM_UPLIFT, CITIES_DB
+import hashlib
+from datetime import date
+
+from config import HOUSE_COEFS, REALISM_UPLIFT, get_provider
+from pipeline_compiler import pipeline_volume_sources
+from profiling import STATS
 
 # ======================================================================================
 # 1. ЛОГИКА РАСЧЕТА ОБЪЕМОВ ПОТРЕБЛЕНИЯ (ПАТТЕРН "СТРАТЕГИЯ")
 # ======================================================================================
 
 # --- ИЗМЕНЕНИЕ: Функция теперь принимает 'config', чтобы получить из него heating_months ---
-def _calculate_volumes_minsk_model(area_m2, occupants, month, behavior_factor, config):
+# heating_season(month, heating_months) -> 1/0 (или массив) - проверка отопительного сезона;
+# batch_engine подставляет векторную версию, формулы остаются общими.
+def _calculate_volumes_minsk_model(area_m2, occupants, month, behavior_factor, config, heating_season=None):
     # Теперь мы берем отопительные месяцы из конфигурации, а не из воздуха
     heating_months = config.get("heating_months", [])
     elec = (60.0 + 75.0 * occupants + 0.5 * area_m2) * behavior_factor
     water = 4.5 * occupants * behavior_factor
     # Формула теперь будет работать правильно, т.к. heating_months не пустой
-    heat_monthly = (0.15 * area_m2) / len(heating_months) if month in heating_months and heating_months else 0.0
+    # (умножение на 1.0 или 0.0 точное, результат тот же, что у прежнего if/else)
+    if heating_months:
+        in_season = (1.0 if month in heating_months else 0.0) if heating_season is None else heating_season(month, heating_months)
+        heat_monthly = (0.15 * area_m2) / len(heating_months) * in_season
+    else:
+        heat_monthly = 0.0 * area_m2
     return {"Электроэнергия": elec, "Вода": water, "Канализация": water, "Отопление": heat_monthly}
 
 def _calculate_volumes_limassol_model(area_m2, occupants, month, behavior_factor, config):
@@ -27,11 +39,15 @@ VOLUME_CALCULATION_STRATEGIES = {
 }
 
 # --- УНИВЕРСАЛЬНЫЙ ДВИЖОК РАСЧЕТА ОБЪЕМОВ ---
-def calculate_volumes(city, area_m2, occupants, month, behavior_factor):
-    city_config = CITIES_DB.get(city, {})
+# provider - источник конфигурации (config_provider.TariffConfigProvider);
+# по умолчанию используется общий провайдер из config.get_provider().
+def calculate_volumes(city, area_m2, occupants, month, behavior_factor, provider=None):
+    city_config = (provider or get_provider()).city_config(city)
     model_name = city_config.get("volume_model", "")
     strategy_function = VOLUME_CALCULATION_STRATEGIES.get(model_name)
     if strategy_function:
+        if STATS.enabled:
+            strategy_function = STATS.timed("volume_strategy", (model_name,), strategy_function)
         # Передаем city_config в стратегию, чтобы она могла взять heating_months
         return strategy_function(area_m2, occupants, month, behavior_factor, city_config)
     return {}
@@ -51,10 +67,12 @@ def _apply_progressive_rate_op(volume, brackets):
         remaining_volume -= vol_in_bracket
     return cost
 
-def _execute_pipeline(pipeline, rule, volumes, calculation_params):
+# trace - необязательный список, в который после каждого шага добавляется
+# {"step": номер шага (для вложенных конвейеров - через точку), "operator", "value"}
+def _execute_pipeline(pipeline, rule, volumes, calculation_params, trace=None, path=""):
     current_value = 0
     params = rule.get("params", {})
-    for step in pipeline:
+    for i, step in enumerate(pipeline):
         op = step.get("operator")
         if op == "get_volume": current_value = volumes.get(step["source"], 0)
         elif op == "get_param": current_value = calculation_params.get(step["param_key"], 0)
@@ -73,18 +91,32 @@ def _execute_pipeline(pipeline, rule, volumes, calculation_params):
             key_to_use = step["value_if_true"] if is_true else step["value_if_false"]
             current_value = params.get(key_to_use, 0)
         elif op == "sum_of_steps":
-            current_value = sum(_execute_pipeline(sub_pipeline, rule, volumes, calculation_params) for sub_pipeline in step.get("pipelines", []))
+            if trace is None:
+                current_value = sum(_execute_pipeline(sub_pipeline, rule, volumes, calculation_params) for sub_pipeline in step.get("pipelines", []))
+            else:
+                current_value = sum(_execute_pipeline(sub_pipeline, rule, volumes, calculation_params, trace, f"{path}{i}.{j}.")
+                                    for j, sub_pipeline in enumerate(step.get("pipelines", [])))
         elif op == "apply_vat": current_value *= (1 + rule.get("vat", 0))
         elif op == "apply_subsidy":
             keys = step.get("params_keys", []); s_rate, f_rate = params.get(keys[0], 0), params.get(keys[1], 0)
             multiplier = calculation_params.get("subsidy_multiplier", 1.0)
             rate = s_rate * multiplier + f_rate * (1 - multiplier)
             current_value *= rate
+        if trace is not None: trace.append({"step": f"{path}{i}", "operator": op, "value": current_value})
     return current_value
 
-def calculate_costs(city, volumes, calculation_params):
-    costs = {service: round(_execute_pipeline(rule.get("pipeline", []), rule, volumes, calculation_params), 2)
-             for service, rule in TARIFFS_DB.get(city, {}).items()}
+# --- СКОМПИЛИРОВАННЫЕ КОНВЕЙЕРЫ ---
+# _execute_pipeline остается эталонным интерпретатором, а в расчетах используются
+# конвейеры, которые провайдер компилирует один раз на загруженную конфигурацию города.
+# При включенном профилировании берется вариант с замером шагов (см. profiling.py).
+# as_of - дата тарифов (date или 'ГГГГ-ММ-ДД') для расчета прошлых периодов;
+# по умолчанию - дата провайдера (сегодня).
+def get_compiled_tariffs(city, vectorized=False, provider=None, as_of=None):
+    return (provider or get_provider()).compiled_tariffs(city, vectorized, STATS.enabled, as_of)
+
+def calculate_costs(city, volumes, calculation_params, provider=None, as_of=None):
+    costs = {service: round(run(volumes, calculation_params), 2)
+             for service, run in get_compiled_tariffs(city, provider=provider, as_of=as_of)}
     costs["Итого"] = round(sum(v for k, v in costs.items() if k != "Итого"), 2)
     return costs
 
@@ -99,4 +131,153 @@ def apply_neighbor_adjustment(costs, house_category):
     if "Отопление" in adjusted_costs: adjusted_costs["Отопление"] *= house_coef.get("heating", 1.0)
     final_costs = {k: v * REALISM_UPLIFT for k, v in adjusted_costs.items() if k != "Итого"}
     final_costs["Итого"] = round(sum(final_costs.values()), 2)
-    return final_costs
\ No newline at end of file
+    return final_costs
+
+# ======================================================================================
+# 4. ГОДОВОЙ ПРОГНОЗ
+# ======================================================================================
+# От месяца зависят только объемы (отопительный сезон), поэтому каждая услуга
+# пересчитывается лишь при изменении тех объемов, которые читает ее конвейер.
+# Фиксированные платежи, интернет, телефон считаются один раз на весь год, отопление -
+# по разу для отопительных и неотопительных месяцев. Кэш общий для идеального расчета
+# и соседа: одинаковые входы не пересчитываются дважды.
+#
+# С year каждый месяц считается по тарифам на 1-е число этого месяца года year
+# (периоды valid_from/valid_to), без него - все месяцы по тарифам на дату провайдера.
+
+MONTHS = list(range(1, 13))
+
+def calculate_annual_costs(city, household, provider=None, year=None):
+    """12-месячная матрица стоимостей и годовые итоги для идеального расчета и соседа.
+
+    household - словарь с area_m2, occupants и необязательными behavior_factor (по умолчанию 1.0)
+    и house_category; остальные ключи (floor, subsidy_multiplier, ...) идут в calculation_params.
+    Возвращает {"ideal": [...], "neighbor": [...], "ideal_year": {...}, "neighbor_year": {...}},
+    где списки содержат по словарю стоимостей на каждый месяц (январь - первый).
+    """
+    provider = provider or get_provider()
+    area_m2, occupants = household["area_m2"], household["occupants"]
+    behavior_factor = household.get("behavior_factor", 1.0)
+    house_category = household.get("house_category")
+    calculation_params = {k: v for k, v in household.items() if k not in ("behavior_factor", "house_category")}
+
+    city_config = provider.city_config(city)
+    model_name = city_config.get("volume_model", "")
+    strategy_function = VOLUME_CALCULATION_STRATEGIES.get(model_name)
+    if strategy_function and STATS.enabled:
+        strategy_function = STATS.timed("volume_strategy", (model_name,), strategy_function)
+    month_dates = [date(year, month, 1).isoformat() if year else None for month in MONTHS]
+    # Даты одного периода тарифов провайдер отдает одним и тем же объектом tariffs,
+    # поэтому такие месяцы делят конвейеры и кэш
+    services_by_date, services_by_tariffs = {}, {}
+    for as_of in month_dates:
+        if as_of in services_by_date: continue
+        tariffs = provider.tariffs(city, as_of)
+        if id(tariffs) not in services_by_tariffs:
+            services_by_tariffs[id(tariffs)] = [
+                (service, run, pipeline_volume_sources(tariffs[service].get("pipeline", [])))
+                for service, run in get_compiled_tariffs(city, provider=provider, as_of=as_of)]
+        services_by_date[as_of] = services_by_tariffs[id(tariffs)]
+    service_cache = {}
+
+    def monthly_costs(volumes, services):
+        costs = {}
+        for service, run, sources in services:
+            key = (run,) + tuple(volumes.get(source, 0) for source in sources)
+            if key not in service_cache:
+                service_cache[key] = round(run(volumes, calculation_params), 2)
+            costs[service] = service_cache[key]
+        costs["Итого"] = round(sum(v for k, v in costs.items() if k != "Итого"), 2)
+        return costs
+
+    # Объемы по месяцам считаем один раз на каждый коэффициент поведения, а месяцы
+    # с одинаковыми объемами (весь неотопительный сезон) получают один и тот же расчет.
+    variants = {}
+    for factor in (1.0, behavior_factor):
+        if factor in variants: continue
+        by_volumes, monthly = {}, []
+        for month, as_of in zip(MONTHS, month_dates):
+            volumes = strategy_function(area_m2, occupants, month, factor, city_config) if strategy_function else {}
+            key = (as_of, tuple(volumes.items()))
+            if key not in by_volumes:
+                by_volumes[key] = monthly_costs(volumes, services_by_date[as_of])
+            monthly.append(by_volumes[key])
+        variants[factor] = monthly
+
+    ideal = [dict(costs) for costs in variants[1.0]]
+    adjusted = {}
+    neighbor = []
+    for costs in variants[behavior_factor]:
+        if id(costs) not in adjusted:
+            adjusted[id(costs)] = apply_neighbor_adjustment(costs, house_category)
+        neighbor.append(dict(adjusted[id(costs)]))
+    return {
+        "ideal": ideal,
+        "neighbor": neighbor,
+        "ideal_year": _sum_months(ideal),
+        "neighbor_year": _sum_months(neighbor),
+    }
+
+def _sum_months(monthly):
+    totals = {}
+    for costs in monthly:
+        for service, value in costs.items():
+            totals[service] = totals.get(service, 0) + value
+    return {service: round(value, 2) for service, value in totals.items()}
+
+# ======================================================================================
+# 5. ТРАССИРОВКА
+# ======================================================================================
+# Для разбора "почему услуга стоит столько" один расчет прогоняется через эталонный
+# интерпретатор с записью current_value после каждого шага. Результат сверяется
+# со скомпилированным конвейером, которым пользуется движок.
+
+def trace_calculation(city, area_m2, occupants, month, behavior_factor, calculation_params, provider=None):
+    """Пошаговая трассировка одного расчета.
+
+    Возвращает {"volumes": {...}, "services": {услуга: {"steps": [...], "result": ..., "compiled": ...}}},
+    где steps - записи {"step", "operator", "value"} из _execute_pipeline, result - итог
+    интерпретатора, compiled - итог скомпилированного конвейера (оба округлены до копеек).
+    """
+    provider = provider or get_provider()
+    volumes = calculate_volumes(city, area_m2, occupants, month, behavior_factor, provider)
+    compiled = dict(get_compiled_tariffs(city, provider=provider))
+    services = {}
+    for service, rule in provider.tariffs(city).items():
+        steps = []
+        result = _execute_pipeline(rule.get("pipeline", []), rule, volumes, calculation_params, steps)
+        services[service] = {
+            "steps": steps,
+            "result": round(result, 2),
+            "compiled": round(compiled[service](volumes, calculation_params), 2),
+        }
+    return {"volumes": volumes, "services": services}
+
+# ======================================================================================
+# 6. ВЕРСИЯ КОДА ДВИЖКА
+# ======================================================================================
+# Кэш результатов (result_cache.py) и сетки (cost_grid.py) хранят значения между
+# процессами, поэтому должны устаревать при правке формул. Хэш строится из байткода,
+# имен и констант функций; вложенные code-объекты (генераторы словарей, lambda)
+# хэшируются по содержимому - их repr содержит адрес в памяти и разный в каждом процессе.
+
+def _code_digest(code):
+    parts = [code.co_code.hex(), list(code.co_names)]
+    for const in code.co_consts:
+        parts.append(_const_digest(const))
+    return hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()
+
+def _const_digest(const):
+    if hasattr(const, "co_code"):
+        return _code_digest(const)
+    if isinstance(const, tuple):
+        return [_const_digest(c) for c in const]
+    if isinstance(const, frozenset):
+        # Порядок элементов frozenset зависит от PYTHONHASHSEED
+        return sorted(repr(_const_digest(c)) for c in const)
+    return repr(const)
+
+def code_version(functions):
+    return hashlib.sha256("".join(_code_digest(f.__code__) for f in functions).encode("utf-8")).hexdigest()[:16]
+
+ENGINE_CODE_VERSION = code_version([f for _, f in sorted(VOLUME_CALCULATION_STRATEGIES.items())] + [apply_neighbor_adjustment])
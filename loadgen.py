@@ -0,0 +1,139 @@
+# loadgen.py
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import time
+
+# ======================================================================================
+# ГЕНЕРАТОР НАГРУЗКИ ДЛЯ service.py
+# ======================================================================================
+# concurrency клиентов с постоянными (keep-alive) соединениями в течение duration секунд
+# шлют POST /costs со случайными домохозяйствами. В конце печатаются пропускная
+# способность, p50/p90/p99/максимум задержки и число отказов (503) и ошибок.
+#
+# Пример (сервис запускается отдельно или через --spawn):
+#   python loadgen.py --spawn --concurrency 64 --duration 10
+
+HOUSE_CATEGORIES = ["Новый", "Средний", "Старый", None]
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values: return float("nan")
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def _request(reader, writer, host, path, payload):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    writer.write((f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                  f"Content-Length: {len(body)}\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""): break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length": length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def _client(host, port, cities, deadline, rng, latencies, counters):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            payload = {
+                "city": rng.choice(cities), "month": rng.randint(1, 12),
+                "area_m2": round(rng.uniform(20, 200), 1), "occupants": rng.randint(1, 6),
+                "behavior_factor": rng.choice([0.85, 1.0, 1.25]),
+                "subsidy_multiplier": rng.choice([0.0, 1.0]),
+                "house_category": rng.choice(HOUSE_CATEGORIES),
+            }
+            started = time.perf_counter()
+            status = await _request(reader, writer, host, "/costs", payload)
+            if status == 200:
+                latencies.append(time.perf_counter() - started)
+            elif status == 503:
+                counters["rejected"] += 1
+            else:
+                counters["errors"] += 1
+    finally:
+        writer.close()
+
+
+async def _get_json(host, port, path):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode("latin-1"))
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+    return json.loads(response.split(b"\r\n\r\n", 1)[1])
+
+
+async def run_load(host, port, cities, concurrency=64, duration=10.0, seed=0):
+    latencies, counters = [], {"rejected": 0, "errors": 0}
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(_client(host, port, cities, deadline, random.Random(seed + i), latencies, counters)
+                           for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": len(latencies), "elapsed_s": elapsed, "throughput_rps": len(latencies) / elapsed,
+        "p50_ms": _percentile(latencies, 50) * 1000, "p90_ms": _percentile(latencies, 90) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "max_ms": (latencies[-1] if latencies else float("nan")) * 1000, **counters,
+    }
+
+
+async def _wait_until_ready(host, port, timeout=30.0):
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            return await _get_json(host, port, "/health")
+        except (OSError, ValueError, IndexError):
+            if time.perf_counter() > deadline: raise
+            await asyncio.sleep(0.2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест HTTP-сервиса расчета")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--cities", nargs="*", default=["Минск", "Лимасол"])
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10.0, help="длительность, с")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--spawn", action="store_true", help="запустить service.py на время теста")
+    parser.add_argument("--workers", type=int, default=None, help="воркеров для --spawn")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.spawn:
+        command = [sys.executable, "service.py", "--host", args.host, "--port", str(args.port)]
+        if args.workers is not None: command += ["--workers", str(args.workers)]
+        server = subprocess.Popen(command, cwd=sys.path[0] or None)
+    try:
+        asyncio.run(_wait_until_ready(args.host, args.port))
+        report = asyncio.run(run_load(args.host, args.port, args.cities, args.concurrency, args.duration, args.seed))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print(f"Запросов: {report['requests']} за {report['elapsed_s']:.1f} с, "
+          f"{report['throughput_rps']:,.0f} запросов/с (клиентов: {args.concurrency})")
+    print(f"Задержка: p50 {report['p50_ms']:.2f} мс, p90 {report['p90_ms']:.2f} мс, "
+          f"p99 {report['p99_ms']:.2f} мс, максимум {report['max_ms']:.2f} мс")
+    print(f"Отказов (503): {report['rejected']}, ошибок: {report['errors']}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# neighbor_simulation.py
+import numpy as np
+import pandas as pd
+
+from batch_engine import apply_neighbor_adjustment_batch, calculate_costs_batch
+from config import NEIGHBOR_DISTRIBUTIONS
+
+# ======================================================================================
+# МОДЕЛИРОВАНИЕ СОСЕДЕЙ МЕТОДОМ МОНТЕ-КАРЛО
+# ======================================================================================
+# Вместо одного "среднего соседа" (apply_neighbor_adjustment) разыгрываются тысячи
+# домохозяйств города: коэффициент поведения, число жильцов, площадь и категория дома
+# берутся из распределений (config.NEIGHBOR_DISTRIBUTIONS или свои), стоимости считаются
+# векторно через batch_engine, включая корректировку соседа. Генератор - numpy
+# default_rng(seed): при тех же seed, распределениях и тарифах результат тот же.
+#
+#   costs = simulate_neighbors("Минск", month=1, draws=50_000, seed=0)
+#   table = neighbor_percentiles(costs)               # перцентили 0..100 по услугам
+#   table.loc[[10, 50, 90]]                           # полосы p10/p50/p90
+#   rank_among_neighbors(table, {"Вода": 30.0})       # {"Вода": доля соседей, %}
+
+# Порядок розыгрыша фиксирован: изменение одного распределения не сдвигает остальные
+SAMPLED_FIELDS = ("behavior_factor", "occupants", "area_m2", "house_category")
+
+
+def _sample(rng, spec, n):
+    kind = spec["kind"]
+    if kind == "choice":
+        values = spec["values"]
+        weights = np.asarray(spec.get("weights") or [1.0] * len(values), dtype=float)
+        codes = rng.choice(len(values), size=n, p=weights / weights.sum())
+        if all(isinstance(value, str) or value is None for value in values):
+            # Категории - pd.Categorical: коды без массива строк, None - пропуск (код -1)
+            categories = [value for value in values if value is not None]
+            slots = np.array([-1 if value is None else categories.index(value) for value in values])
+            return pd.Categorical.from_codes(slots[codes], categories)
+        return np.asarray(values)[codes]
+    if kind == "fixed":
+        sample = np.full(n, spec["value"])
+    elif kind == "uniform":
+        sample = rng.uniform(spec["low"], spec["high"], n)
+    elif kind == "normal":
+        sample = rng.normal(spec["mean"], spec["std"], n)
+    elif kind == "lognormal":
+        sample = rng.lognormal(np.log(spec["median"]), spec["sigma"], n)
+    else:
+        raise ValueError(f"Неизвестный вид распределения: {kind}")
+    if "low" in spec or "high" in spec:
+        sample = np.clip(sample, spec.get("low"), spec.get("high"))
+    return sample
+
+
+def sample_neighbors(n, distributions=None, seed=0):
+    """Словарь массивов behavior_factor/occupants/area_m2/house_category длины n."""
+    distributions = {**NEIGHBOR_DISTRIBUTIONS, **(distributions or {})}
+    rng = np.random.default_rng(seed)
+    return {field: _sample(rng, distributions[field], n) for field in SAMPLED_FIELDS}
+
+
+def simulate_neighbors(city, month, calculation_params=None, draws=50_000, seed=0, distributions=None, provider=None):
+    """Стоимости draws смоделированных соседей: DataFrame с колонкой на услугу и 'Итого'.
+
+    calculation_params - прочие параметры расчета, общие для всех соседей (floor,
+    subsidy_multiplier, ...); area_m2 и occupants в нем заменяются разыгранными.
+    Чтобы сравнивать только с похожими домохозяйствами, задайте в distributions
+    {"kind": "fixed", "value": ...} для площади или числа жильцов.
+    """
+    neighbors = sample_neighbors(draws, distributions, seed)
+    frame = {key: np.full(draws, value) for key, value in (calculation_params or {}).items()}
+    frame.update(area_m2=neighbors["area_m2"], occupants=neighbors["occupants"], month=np.full(draws, month),
+                 behavior_factor=neighbors["behavior_factor"])
+    costs = calculate_costs_batch(city, frame, provider=provider)
+    return apply_neighbor_adjustment_batch(costs, neighbors["house_category"])
+
+
+def neighbor_percentiles(costs, percentiles=range(101)):
+    """Перцентили стоимостей по услугам: строка на перцентиль, колонка на услугу."""
+    percentiles = list(percentiles)
+    # Одна сортировка и линейная интерполяция (как np.percentile по умолчанию):
+    # np.percentile делает отдельное разбиение на каждый из 101 перцентилей
+    values = np.sort(costs.to_numpy(), axis=0)
+    positions = np.asarray(percentiles, dtype=float) / 100 * (len(values) - 1)
+    lower = np.floor(positions).astype(int)
+    upper = np.minimum(lower + 1, len(values) - 1)
+    fraction = (positions - lower)[:, None]
+    bands = values[lower] + (values[upper] - values[lower]) * fraction
+    return pd.DataFrame(bands, index=percentiles, columns=costs.columns)
+
+
+def rank_among_neighbors(table, user_costs):
+    """Место пользователя среди соседей по таблице neighbor_percentiles: {услуга: перцентиль 0..100}.
+
+    Перцентиль - примерная доля соседей (%), тратящих не больше пользователя.
+    Услуги, которых нет в таблице, пропускаются.
+    """
+    percentiles = table.index.to_numpy(dtype=float)
+    return {service: float(np.interp(value, table[service].to_numpy(), percentiles))
+            for service, value in user_costs.items() if service in table.columns}
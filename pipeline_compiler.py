@@ -0,0 +1,217 @@
+# pipeline_compiler.py
+import operator
+from bisect import bisect_left
+
+# ======================================================================================
+# КОМПИЛЯТОР КОНВЕЙЕРОВ ТАРИФОВ
+# ======================================================================================
+# JSON-описание конвейера из TARIFFS_DB один раз превращается в цепочку замыканий
+# step(value, volumes, calculation_params) -> value. Все значения из 'params' и 'vat'
+# читаются на этапе компиляции, ступени прогрессивной шкалы сортируются заранее.
+# Результат совпадает с интерпретатором engine._execute_pipeline бит в бит:
+# порядок арифметических операций сохранен.
+#
+# С vectorized=True те же конвейеры работают над массивами NumPy (см. batch_engine.py):
+# большинство шагов и так поэлементные, отдельной реализации требуют только условия
+# (np.where) и прогрессивная шкала (np.searchsorted по накопленным границам).
+#
+# Если передан stats (profiling.EngineStats), каждый шаг и каждый конвейер услуги
+# оборачиваются замером времени. В этом режиме шаги не выбрасываются и не сворачиваются
+# в константы: выполняется и замеряется вся цепочка, как в интерпретаторе.
+
+_CONDITIONS = {"gt": operator.gt, "lt": operator.lt, "eq": operator.eq}
+
+# Операторы, которые перезаписывают текущее значение: все шаги до них можно отбросить
+_RESETTING_OPERATORS = {"get_volume", "get_param", "get_fixed_amount", "apply_conditional_value", "sum_of_steps"}
+
+
+def _never(param_to_check, threshold):
+    return False
+
+
+def compile_brackets(brackets, vectorized=False):
+    """Сортирует ступени и заранее считает накопленные границы и стоимости.
+
+    Возвращает функцию volume -> cost, эквивалентную engine._apply_progressive_rate_op.
+    """
+    ordered = sorted(brackets, key=lambda x: x.get('from', 0))
+    widths = [b.get('to', float('inf')) - b.get('from', 0) + 1 for b in ordered]
+    rates = [b.get('rate', 0) for b in ordered]
+
+    bounds, base_costs = [], []
+    total_width = 0; total_cost = 0
+    for width, rate in zip(widths, rates):
+        base_costs.append(total_cost)
+        total_width += width
+        bounds.append(total_width)
+        total_cost += width * rate
+
+    # Быстрый путь через bisect точен, только если ширины ступеней - целые положительные числа
+    # (тогда остаток объема в ступени вычисляется без ошибки округления).
+    fast_path = all(w > 0 and (w == float('inf') or float(w).is_integer()) for w in widths)
+    pairs = tuple(zip(widths, rates))
+
+    if vectorized:
+        return _vectorize_brackets(pairs, bounds, base_costs, rates, total_cost, fast_path)
+    if fast_path:
+        def progressive(volume):
+            if volume <= 0: return 0
+            idx = bisect_left(bounds, volume)
+            if idx == len(bounds): return total_cost
+            previous = bounds[idx - 1] if idx else 0
+            return base_costs[idx] + (volume - previous) * rates[idx]
+    else:
+        def progressive(volume):
+            cost = 0; remaining_volume = volume
+            for width, rate in pairs:
+                if remaining_volume <= 0: break
+                vol_in_bracket = min(remaining_volume, width)
+                cost += vol_in_bracket * rate
+                remaining_volume -= vol_in_bracket
+            return cost
+
+    return progressive
+
+
+def _vectorize_brackets(pairs, bounds, base_costs, rates, total_cost, fast_path):
+    import numpy as np
+
+    if fast_path:
+        # Индекс len(bounds) означает объем выше последней границы: берем полную стоимость
+        # и нулевой тариф, (volume - bounds[-1]) * 0 ничего не добавит.
+        prev_bounds = np.array([0] + bounds, dtype=float)
+        base_ext = np.array(base_costs + [total_cost], dtype=float)
+        rates_ext = np.array(rates + [0], dtype=float)
+        bounds_arr = np.array(bounds, dtype=float)
+
+        def progressive(volume):
+            volume = np.asarray(volume, dtype=float)
+            idx = np.searchsorted(bounds_arr, volume, side="left")
+            cost = base_ext[idx] + (volume - prev_bounds[idx]) * rates_ext[idx]
+            return np.where(volume <= 0, 0.0, cost)
+    else:
+        def progressive(volume):
+            cost = 0; remaining_volume = np.asarray(volume, dtype=float)
+            for width, rate in pairs:
+                vol_in_bracket = np.where(remaining_volume > 0, np.minimum(remaining_volume, width), 0.0)
+                cost = cost + vol_in_bracket * rate
+                remaining_volume = remaining_volume - vol_in_bracket
+            return cost
+    return progressive
+
+
+def _compile_step(step, rule, vectorized, stats=None):
+    """Возвращает (step_function, is_dynamic) для одного шага конвейера или None."""
+    op = step.get("operator")
+    params = rule.get("params", {})
+
+    if op == "get_volume":
+        source = step["source"]
+        return (lambda value, volumes, cp: volumes.get(source, 0)), True
+    if op == "get_param":
+        key = step["param_key"]
+        return (lambda value, volumes, cp: cp.get(key, 0)), True
+    if op == "get_fixed_amount":
+        amount = params.get(step["param_key"], 0)
+        return (lambda value, volumes, cp: amount), False
+    if op == "add_param":
+        addend = params.get(step["param_key"], 0)
+        return (lambda value, volumes, cp: value + addend), False
+    if op == "multiply_by_param":
+        factor = params.get(step["param_key"], 1)
+        return (lambda value, volumes, cp: value * factor), False
+    if op == "multiply_by_context":
+        key = step["param_key"]
+        return (lambda value, volumes, cp: value * cp.get(key, 1)), True
+    if op == "apply_progressive_rate":
+        progressive = compile_brackets(params.get(step["param_key"], []), vectorized)
+        return (lambda value, volumes, cp: progressive(value)), False
+    if op == "apply_conditional_value":
+        check_param = step["check_param"]
+        threshold = step["threshold"]
+        compare = _CONDITIONS.get(step["condition"], _never)
+        value_if_true = params.get(step["value_if_true"], 0)
+        value_if_false = params.get(step["value_if_false"], 0)
+        if vectorized:
+            import numpy as np
+            return (lambda value, volumes, cp:
+                    np.where(compare(cp.get(check_param, 0), threshold), value_if_true, value_if_false)), True
+        return (lambda value, volumes, cp:
+                value_if_true if compare(cp.get(check_param, 0), threshold) else value_if_false), True
+    if op == "sum_of_steps":
+        compiled = [compile_pipeline(sub_pipeline, rule, vectorized, stats) for sub_pipeline in step.get("pipelines", [])]
+        if not any(is_dynamic for _, is_dynamic in compiled):
+            total = sum(run({}, {}) for run, _ in compiled)
+            return (lambda value, volumes, cp: total), False
+        runs = tuple(run for run, _ in compiled)
+        return (lambda value, volumes, cp: sum(run(volumes, cp) for run in runs)), True
+    if op == "apply_vat":
+        vat_factor = 1 + rule.get("vat", 0)
+        return (lambda value, volumes, cp: value * vat_factor), False
+    if op == "apply_subsidy":
+        keys = step.get("params_keys", []); s_rate, f_rate = params.get(keys[0], 0), params.get(keys[1], 0)
+        return (lambda value, volumes, cp: value * (s_rate * cp.get("subsidy_multiplier", 1.0)
+                                                    + f_rate * (1 - cp.get("subsidy_multiplier", 1.0)))), True
+    # Неизвестные операторы интерпретатор молча пропускает - делаем так же
+    return None
+
+
+def compile_pipeline(pipeline, rule, vectorized=False, stats=None):
+    """Компилирует конвейер в функцию run(volumes, calculation_params).
+
+    Возвращает (run, is_dynamic). Если результат не зависит от входных данных,
+    он вычисляется один раз на этапе компиляции.
+    """
+    steps, dynamic_flags = [], []
+    for step in pipeline:
+        compiled = _compile_step(step, rule, vectorized, stats)
+        if compiled is None: continue
+        if stats is not None:
+            steps.append(stats.timed("operator", (step.get("operator"),), compiled[0])); dynamic_flags.append(True)
+            continue
+        if step.get("operator") in _RESETTING_OPERATORS:
+            steps, dynamic_flags = [], []
+        steps.append(compiled[0]); dynamic_flags.append(compiled[1])
+    steps = tuple(steps)
+
+    def run(volumes, calculation_params):
+        value = 0
+        for step in steps:
+            value = step(value, volumes, calculation_params)
+        return value
+
+    if not any(dynamic_flags):
+        constant = run({}, {})
+        return (lambda volumes, calculation_params: constant), False
+    if len(steps) == 1:
+        only = steps[0]
+        return (lambda volumes, calculation_params: only(0, volumes, calculation_params)), True
+    if len(steps) == 2:
+        first, second = steps
+        return (lambda volumes, calculation_params:
+                second(first(0, volumes, calculation_params), volumes, calculation_params)), True
+    return run, True
+
+
+def compile_tariffs(city_tariffs, vectorized=False, stats=None, city=""):
+    """Компилирует все услуги города: кортеж пар (service, run) в порядке TARIFFS_DB."""
+    compiled = []
+    for service, rule in city_tariffs.items():
+        run = compile_pipeline(rule.get("pipeline", []), rule, vectorized, stats)[0]
+        if stats is not None:
+            run = stats.timed("pipeline", (city, service), run)
+        compiled.append((service, run))
+    return tuple(compiled)
+
+
+def pipeline_volume_sources(pipeline):
+    """Объемы (ключи volumes), которые читает конвейер, включая вложенные sum_of_steps."""
+    sources = []
+    for step in pipeline:
+        op = step.get("operator")
+        if op == "get_volume" and step["source"] not in sources:
+            sources.append(step["source"])
+        elif op == "sum_of_steps":
+            for sub_pipeline in step.get("pipelines", []):
+                sources += [s for s in pipeline_volume_sources(sub_pipeline) if s not in sources]
+    return sources
@@ -0,0 +1,145 @@
+# profiling.py
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# ======================================================================================
+# ПРОФИЛИРОВАНИЕ ДВИЖКА
+# ======================================================================================
+# Включаемый по требованию сбор числа вызовов и времени:
+#   operator         - каждый шаг конвейера (по имени оператора; время sum_of_steps
+#                      включает вложенные конвейеры);
+#   pipeline         - конвейер услуги целиком (город, услуга);
+#   volume_strategy  - стратегии объемов (VOLUME_CALCULATION_STRATEGIES и пакетные);
+#   config_load      - загрузка конфигурации из БД (load_config_from_db и погородная
+#                      загрузка в TariffConfigProvider);
+#   app              - запуск и перерисовки streamlit_app.py (импорт модулей, первая
+#                      отрисовка, каждая перерисовка).
+# Пока профилирование выключено, движок работает с обычными скомпилированными
+# конвейерами, а в горячих местах остается одна проверка STATS.enabled.
+# Загрузка конфигурации и замеры app редкие и сами по себе дорогие, поэтому пишутся всегда:
+# иначе первая загрузка при старте приложения была бы потеряна.
+#
+# Включение: profiling.enable() или переменная окружения UTILITY_PROFILE=1 - для всего
+# процесса; STATS.set_thread_enabled(...) - только для текущего потока (в streamlit_app.py
+# так включается профилирование одной сессии, не задевая остальные).
+# Данные: STATS.snapshot() (список словарей), STATS.prometheus_text() (формат Prometheus).
+# Пошаговая трассировка одного расчета - engine.trace_calculation().
+
+# Имена меток для каждого вида замеров
+_LABELS = {
+    "operator": ("operator",),
+    "pipeline": ("city", "service"),
+    "volume_strategy": ("strategy",),
+    "config_load": ("source", "city"),
+    "app": ("phase",),
+}
+
+_HELP = {
+    "operator": "шаги конвейеров тарифов",
+    "pipeline": "конвейеры услуг целиком",
+    "volume_strategy": "стратегии расчета объемов",
+    "config_load": "загрузка конфигурации из БД",
+    "app": "запуск и перерисовки дашборда",
+}
+
+
+class EngineStats:
+    def __init__(self, enabled=False):
+        self.process_enabled = enabled
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._records = {}  # (вид, значения меток) -> [вызовы, суммарное время, максимум]
+
+    @property
+    def enabled(self):
+        # Значение, заданное для потока, важнее общего для процесса
+        local = getattr(self._local, "enabled", None)
+        return self.process_enabled if local is None else local
+
+    @enabled.setter
+    def enabled(self, value):
+        self.process_enabled = value
+
+    def set_thread_enabled(self, enabled):
+        """Включает/выключает профилирование в текущем потоке; None - как у процесса."""
+        self._local.enabled = enabled
+
+    def record(self, kind, labels, seconds):
+        with self._lock:
+            entry = self._records.get((kind, labels))
+            if entry is None:
+                self._records[(kind, labels)] = [1, seconds, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+                if seconds > entry[2]: entry[2] = seconds
+
+    def timed(self, kind, labels, function):
+        """Обертка над function, которая записывает каждый вызов."""
+        record, clock = self.record, time.perf_counter
+
+        def wrapper(*args):
+            started = clock()
+            try:
+                return function(*args)
+            finally:
+                record(kind, labels, clock() - started)
+        return wrapper
+
+    @contextmanager
+    def measure(self, kind, labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(kind, labels, time.perf_counter() - started)
+
+    def reset(self):
+        with self._lock:
+            self._records.clear()
+
+    def snapshot(self):
+        """Список словарей: kind, метки вида, calls, total_s, mean_s, max_s."""
+        with self._lock:
+            items = sorted((key, list(entry)) for key, entry in self._records.items())
+        rows = []
+        for (kind, labels), (calls, total, longest) in items:
+            row = {"kind": kind}
+            row.update(zip(_LABELS[kind], labels))
+            row.update(calls=calls, total_s=total, mean_s=total / calls, max_s=longest)
+            rows.append(row)
+        return rows
+
+    def prometheus_text(self, prefix="utility_engine"):
+        """Текстовый формат экспозиции Prometheus."""
+        by_kind = {}
+        for row in self.snapshot():
+            by_kind.setdefault(row["kind"], []).append(row)
+        lines = []
+        for kind, rows in by_kind.items():
+            metrics = (("calls_total", "counter", "calls", "число вызовов"),
+                       ("seconds_total", "counter", "total_s", "суммарное время, с"),
+                       ("seconds_max", "gauge", "max_s", "самый долгий вызов, с"))
+            for suffix, metric_type, field, description in metrics:
+                name = f"{prefix}_{kind}_{suffix}"
+                lines.append(f"# HELP {name} {_HELP[kind]}: {description}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for row in rows:
+                    labels = ",".join(f'{label}="{_escape(row[label])}"' for label in _LABELS[kind])
+                    lines.append(f"{name}{{{labels}}} {row[field]!r}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+STATS = EngineStats(enabled=os.environ.get("UTILITY_PROFILE", "") not in ("", "0"))
+
+def enable():
+    STATS.enabled = True
+
+def disable():
+    STATS.enabled = False
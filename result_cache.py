@@ -0,0 +1,214 @@
+# result_cache.py
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config import HOUSE_COEFS, REALISM_UPLIFT, get_provider
+from engine import ENGINE_CODE_VERSION, calculate_volumes, calculate_costs, apply_neighbor_adjustment
+
+# ======================================================================================
+# ПОСТОЯННЫЙ КЭШ РЕЗУЛЬТАТОВ РАСЧЕТА
+# ======================================================================================
+# Два уровня:
+#   1. LRU в памяти процесса (OrderedDict) с ограничением по числу записей;
+#   2. SQLite в режиме WAL - общий для всех воркеров Streamlit и других процессов.
+# Ключ - хэш от (вид расчета, город, нормализованные параметры домохозяйства,
+# calculation_params, версия тарифов города). Версия - хэш строк города и его тарифов
+# из БД (TariffConfigProvider.tariff_version), поэтому после правки params/pipeline
+# старые записи просто перестают находиться; prune() удаляет их физически.
+# Результат зависит и от кода, поэтому к версии тарифов добавляется ENGINE_VERSION -
+# хэш HOUSE_COEFS, REALISM_UPLIFT, кода стратегий объемов и корректировки соседа
+# (engine.ENGINE_CODE_VERSION, одинаков во всех процессах) и RESULT_FORMAT_VERSION
+# (увеличивать при изменении операторов конвейеров и формата).
+# Записи старой версии движка тоже не находятся и удаляются prune().
+# Запись в SQLite идет пачками: batch_size записей или через flush_interval секунд
+# после первой неподтвержденной записи (по таймеру, даже если процесс простаивает).
+#
+# Кэш хранится в отдельном файле results_cache.db, а не в utilities.db: utilities.db
+# лежит в репозитории, а запись в него заставляла бы провайдер конфигурации
+# считать, что тарифы изменились.
+
+_BASEDIR = os.path.dirname(__file__)
+CACHE_DB_FILE = os.path.join(_BASEDIR, "results_cache.db")
+RESULT_FORMAT_VERSION = 1
+
+
+def _engine_version():
+    parts = [RESULT_FORMAT_VERSION, HOUSE_COEFS, REALISM_UPLIFT, ENGINE_CODE_VERSION]
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+ENGINE_VERSION = _engine_version()
+
+
+def _normalize(value):
+    # 3 и 3.0, np.float64 и float должны давать один и тот же ключ
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, str) or value is None:
+        return value
+    try:
+        return round(float(value), 9)
+    except (TypeError, ValueError):
+        return str(value)
+
+
+class ResultCache:
+    def __init__(self, db_file=CACHE_DB_FILE, max_entries=10_000, batch_size=64, flush_interval=2.0, provider=None):
+        self.db_file = db_file
+        self.max_entries = max_entries
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.provider = provider
+        self._lock = threading.RLock()
+        self._memory = OrderedDict()
+        self._pending = {}
+        self._last_flush = time.monotonic()
+        self._timer = None
+        self._conn = None
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "writes": 0}
+        atexit.register(self.flush)
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_file, check_same_thread=False, timeout=10)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS result_cache (key TEXT PRIMARY KEY, city TEXT, "
+                               "tariff_version TEXT, payload TEXT, created_at REAL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_result_cache_city_version "
+                               "ON result_cache (city, tariff_version)")
+            self._conn.commit()
+        return self._conn
+
+    # --- КЛЮЧИ ---
+
+    def _provider(self):
+        return self.provider or get_provider()
+
+    def _version(self, city):
+        # Хранится в колонке tariff_version: версия тарифов города и версия движка
+        return f"{self._provider().tariff_version(city)}-{ENGINE_VERSION}"
+
+    def make_key(self, kind, city, inputs, calculation_params):
+        version = self._version(city)
+        payload = json.dumps([kind, city, _normalize(inputs), _normalize(calculation_params), version],
+                             ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest(), version
+
+    # --- ЧТЕНИЕ И ЗАПИСЬ ---
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def get(self, key):
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return value
+            pending = self._pending.get(key)
+            row = None if pending is not None else self._connection().execute(
+                "SELECT payload FROM result_cache WHERE key = ?", (key,)).fetchone()
+            if pending is None and row is None:
+                self.stats["misses"] += 1
+                return None
+            value = json.loads(pending[3] if pending is not None else row[0])
+            self._remember(key, value)
+            self.stats["disk_hits"] += 1
+            return value
+
+    def put(self, key, city, version, value):
+        with self._lock:
+            self._remember(key, value)
+            self._pending[key] = (key, city, version, json.dumps(value, ensure_ascii=False), time.time())
+            if len(self._pending) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
+            elif self._timer is None:
+                # Без таймера записи простаивающего воркера не попали бы в общий SQLite до выхода
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if self._timer is not None:
+                if self._timer is not threading.current_thread(): self._timer.cancel()
+                self._timer = None
+            if not self._pending: return
+            rows = list(self._pending.values())
+            conn = self._connection()
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO result_cache (key, city, tariff_version, payload, created_at) "
+                                 "VALUES (?, ?, ?, ?, ?)", rows)
+            self.stats["writes"] += len(rows)
+            self._pending.clear()
+
+    def get_or_compute(self, kind, city, inputs, calculation_params, compute):
+        key, version = self.make_key(kind, city, inputs, calculation_params)
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, city, version, value)
+        return value
+
+    def prune(self):
+        """Удаляет из SQLite записи с устаревшей версией тарифов; возвращает число удаленных."""
+        with self._lock:
+            self.flush()
+            conn = self._connection()
+            removed = 0
+            with conn:
+                for city, version in conn.execute("SELECT DISTINCT city, tariff_version FROM result_cache").fetchall():
+                    if version != self._version(city):
+                        removed += conn.execute("DELETE FROM result_cache WHERE city = ? AND tariff_version = ?",
+                                                (city, version)).rowcount
+            return removed
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_default_cache = None
+
+def get_result_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResultCache()
+    return _default_cache
+
+# ======================================================================================
+# КЭШИРОВАННЫЕ РАСЧЕТЫ
+# ======================================================================================
+
+def cached_costs(city, area_m2, occupants, month, behavior_factor, calculation_params, house_category=None, cache=None):
+    """calculate_volumes -> calculate_costs (-> apply_neighbor_adjustment, если задана house_category) через кэш."""
+    cache = cache or get_result_cache()
+    provider = cache.provider
+    inputs = {"area_m2": area_m2, "occupants": occupants, "month": month, "behavior_factor": behavior_factor,
+              "house_category": house_category}
+
+    def compute():
+        volumes = calculate_volumes(city, area_m2, occupants, month, behavior_factor, provider)
+        costs = calculate_costs(city, volumes, calculation_params, provider)
+        return apply_neighbor_adjustment(costs, house_category) if house_category is not None else costs
+
+    kind = "costs" if house_category is None else "neighbor_costs"
+    # Копия, чтобы изменения у вызывающего кода не попали в кэш
+    return dict(cache.get_or_compute(kind, city, inputs, calculation_params, compute))
@@ -0,0 +1,381 @@
+# service.py
+import argparse
+import asyncio
+import json
+import math
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import numpy as np
+import pandas as pd
+
+from config import get_provider
+from config_provider import TariffConfigProvider
+from db_connector import DB_FILE
+from engine import apply_neighbor_adjustment
+from batch_engine import calculate_volumes_batch, calculate_costs_batch, apply_neighbor_adjustment_batch
+from profiling import STATS
+
+# ======================================================================================
+# HTTP-СЕРВИС РАСЧЕТА
+# ======================================================================================
+# Асинхронный HTTP/1.1 сервер на asyncio (без сторонних веб-фреймворков) поверх движка:
+#   POST /volumes              {"city", "area_m2", "occupants", "month", "behavior_factor"?}
+#                              -> {"volumes": {...}}                       (calculate_volumes)
+#   POST /costs                те же поля + "floor"?, "subsidy_multiplier"?, "house_category"?
+#                              -> {"costs": {...}, "neighbor_costs"?: {...}}
+#                              (calculate_costs, и apply_neighbor_adjustment, если задана категория)
+#   POST /neighbor_adjustment  {"costs": {...}, "house_category"} -> {"costs": {...}}
+#   GET  /health, GET /metrics (формат Prometheus, включая profiling.STATS)
+#
+# Микробатчинг: запросы /volumes и /costs складываются в очередь своего города.
+# Сборщик берет первый запрос, ждет еще до window секунд (или до max_batch запросов)
+# и отправляет всю пачку одним вызовом пакетного движка в пул воркеров - цикл событий
+# только разбирает HTTP. Результаты совпадают со скалярным движком до копейки.
+#
+# Обратное давление: очередь города ограничена queue_size, а в пуле одновременно
+# не больше max_in_flight пачек. Если воркеры не успевают, очередь заполняется,
+# и новые запросы сразу получают 503 с Retry-After вместо бесконечного ожидания.
+#
+# Пример:
+#   python service.py --port 8080 --workers 4
+#   python loadgen.py --port 8080 --concurrency 64 --duration 10
+
+MAX_BODY_BYTES = 1 << 20
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+_WORKER_STATE = {}
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+# ======================================================================================
+# ВОРКЕР: ОДНА ПАЧКА - ОДИН ВЕКТОРНЫЙ РАСЧЕТ
+# ======================================================================================
+
+def _init_worker(db_file):
+    _WORKER_STATE["provider"] = TariffConfigProvider(db_file)
+
+def evaluate_batch(city, columns, house_categories, need_costs):
+    """Считает пачку запросов одного города; возвращает списки по строкам (только встроенные типы)."""
+    provider = _WORKER_STATE.get("provider") or get_provider()
+    frame = pd.DataFrame(columns)
+    n = len(frame)
+    volumes = calculate_volumes_batch(city, frame, provider)
+    result = {"volumes": {name: np.broadcast_to(np.asarray(values, dtype=float), (n,)).tolist()
+                          for name, values in volumes.items()}}
+    if need_costs:
+        costs = calculate_costs_batch(city, frame, volumes, provider)
+        result["costs"] = {name: costs[name].tolist() for name in costs.columns}
+        if any(category is not None for category in house_categories):
+            neighbor = apply_neighbor_adjustment_batch(costs, np.array(house_categories, dtype=object))
+            result["neighbor_costs"] = {name: neighbor[name].tolist() for name in neighbor.columns}
+    return result
+
+# ======================================================================================
+# МИКРОБАТЧИНГ
+# ======================================================================================
+
+def _number(payload, key, default=None, integer=False):
+    if key not in payload and default is None:
+        raise RequestError(400, f"не задано поле {key}")
+    try:
+        value = float(payload.get(key, default))
+    except (TypeError, ValueError) as e:
+        raise RequestError(400, f"некорректное значение {key}: {e}")
+    # nan/inf дали бы в ответе токены NaN, которых нет в JSON
+    if not math.isfinite(value):
+        raise RequestError(400, f"{key} должно быть конечным числом")
+    if integer:
+        # int() молча отбросил бы дробную часть, и расчет шел бы для другого домохозяйства
+        if not value.is_integer():
+            raise RequestError(400, f"{key} должно быть целым числом")
+        return int(value)
+    return value
+
+def _household(payload):
+    row = {
+        "area_m2": _number(payload, "area_m2"),
+        "occupants": _number(payload, "occupants", integer=True),
+        "floor": _number(payload, "floor", 5, integer=True),
+        "subsidy_multiplier": _number(payload, "subsidy_multiplier", 1.0),
+        "month": _number(payload, "month", integer=True),
+        "behavior_factor": _number(payload, "behavior_factor", 1.0),
+    }
+    if not 1 <= row["month"] <= 12:
+        raise RequestError(400, "month должен быть от 1 до 12")
+    return row
+
+def _house_category(payload):
+    category = payload.get("house_category")
+    if category is not None and not isinstance(category, str):
+        raise RequestError(400, "house_category должен быть строкой")
+    return category
+
+
+class CityBatcher:
+    def __init__(self, service, city):
+        self.service = service
+        self.city = city
+        self.queue = asyncio.Queue(maxsize=service.queue_size)
+        self.running = set()  # ссылки на задачи пачек, чтобы их не собрал сборщик мусора
+        self.task = asyncio.create_task(self._collect())
+
+    def submit(self, row, house_category, need_costs):
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((row, house_category, need_costs, future))
+        except asyncio.QueueFull:
+            self.service.stats["rejected"] += 1
+            raise RequestError(503, "очередь расчета переполнена, повторите запрос позже")
+        return future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        service = self.service
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + service.window
+            while len(batch) < service.max_batch:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0: break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Слот в пуле занимаем до отправки: пока воркеры заняты, очередь копится и ограничивает вход
+            await service.slots.acquire()
+            task = asyncio.create_task(self._run(batch))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+
+    async def _evaluate(self, batch):
+        service = self.service
+        columns = {key: [row[key] for row, _, _, _ in batch] for key in batch[0][0]}
+        house_categories = [category for _, category, _, _ in batch]
+        need_costs = any(flag for _, _, flag, _ in batch)
+        result = await asyncio.get_running_loop().run_in_executor(
+            service.executor, evaluate_batch, self.city, columns, house_categories, need_costs)
+        service.stats["batches"] += 1
+        service.stats["batched_requests"] += len(batch)
+        for i, (_, category, _, future) in enumerate(batch):
+            if future.done(): continue  # клиент отключился
+            row = {part: {name: values[i] for name, values in columns_by_name.items()}
+                   for part, columns_by_name in result.items()}
+            if category is None: row.pop("neighbor_costs", None)
+            future.set_result(row)
+
+    async def _run(self, batch):
+        try:
+            try:
+                await self._evaluate(batch)
+            except Exception as e:
+                if len(batch) == 1:
+                    if not batch[0][3].done(): batch[0][3].set_exception(e)
+                    return
+                # Ошибка одного запроса не должна ронять соседей по пачке: пересчитываем по одному
+                self.service.stats["failed_batches"] += 1
+                for item in batch:
+                    try:
+                        await self._evaluate([item])
+                    except Exception as e:
+                        if not item[3].done(): item[3].set_exception(e)
+        finally:
+            self.service.slots.release()
+
+# ======================================================================================
+# СЕРВИС
+# ======================================================================================
+
+class CalculationService:
+    def __init__(self, workers=None, window=0.002, max_batch=1024, queue_size=10_000,
+                 max_in_flight=None, db_file=DB_FILE):
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+        self.window = window
+        self.max_batch = max_batch
+        self.queue_size = queue_size
+        self.max_in_flight = max_in_flight or max(self.workers, 1) * 2
+        self.db_file = db_file
+        self.provider = get_provider() if db_file == DB_FILE else TariffConfigProvider(db_file)
+        self.executor = None
+        self.slots = None
+        self.batchers = {}
+        self.stats = {"requests": 0, "errors": 0, "rejected": 0, "batches": 0, "batched_requests": 0,
+                      "failed_batches": 0}
+
+    async def start(self, host="127.0.0.1", port=8080):
+        if self.workers == 0:
+            # Без отдельных процессов: один поток с общим провайдером (удобно для отладки)
+            _WORKER_STATE["provider"] = self.provider
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        else:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                                initargs=(self.db_file,))
+        self.slots = asyncio.Semaphore(self.max_in_flight)
+        return await asyncio.start_server(self._handle_connection, host, port)
+
+    def close(self):
+        for batcher in self.batchers.values():
+            batcher.task.cancel()
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+    # --- МАРШРУТЫ ---
+
+    def _batcher(self, city):
+        if not isinstance(city, str):
+            raise RequestError(400, "city должен быть строкой")
+        batcher = self.batchers.get(city)
+        if batcher is None:
+            if city not in self.provider.city_names():
+                raise RequestError(404, f"город не найден: {city}")
+            batcher = CityBatcher(self, city)
+            self.batchers[city] = batcher
+        return batcher
+
+    async def _calculate(self, payload, need_costs):
+        batcher = self._batcher(payload.get("city"))
+        house_category = _house_category(payload) if need_costs else None
+        result = await batcher.submit(_household(payload), house_category, need_costs)
+        return {"volumes": result["volumes"]} if not need_costs else {
+            key: value for key, value in result.items() if key != "volumes"}
+
+    async def dispatch(self, method, path, body):
+        if path == "/health" and method == "GET":
+            return 200, {"status": "ok"}
+        if path == "/metrics" and method == "GET":
+            return 200, self.metrics_text()
+        if path not in ("/volumes", "/costs", "/neighbor_adjustment"):
+            raise RequestError(404, f"неизвестный путь: {path}")
+        if method != "POST":
+            raise RequestError(405, "ожидается POST")
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError as e:
+            raise RequestError(400, f"некорректный JSON: {e}")
+        if not isinstance(payload, dict):
+            raise RequestError(400, "ожидается JSON-объект")
+        if path == "/neighbor_adjustment":
+            costs = payload.get("costs")
+            if not isinstance(costs, dict):
+                raise RequestError(400, "не задано поле costs")
+            if not all(isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+                       for value in costs.values()):
+                raise RequestError(400, "значения costs должны быть конечными числами")
+            return 200, {"costs": apply_neighbor_adjustment(costs, _house_category(payload))}
+        return 200, await self._calculate(payload, need_costs=(path == "/costs"))
+
+    def metrics_text(self):
+        lines = []
+        for name, value in self.stats.items():
+            lines.append(f"# TYPE utility_service_{name}_total counter")
+            lines.append(f"utility_service_{name}_total {value}")
+        lines.append("# TYPE utility_service_queue_depth gauge")
+        for city, batcher in self.batchers.items():
+            city_label = city.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            lines.append(f'utility_service_queue_depth{{city="{city_label}"}} {batcher.queue.qsize()}')
+        return "\n".join(lines) + "\n" + STATS.prometheus_text()
+
+    # --- HTTP ---
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line: break
+                keep_alive = True
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                    headers = {}
+                    while True:
+                        line = await reader.readline()
+                        if line in (b"\r\n", b"\n", b""): break
+                        name, _, value = line.decode("latin-1").partition(":")
+                        headers[name.strip().lower()] = value.strip()
+                    keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                    length = int(headers.get("content-length") or 0)
+                    if length > MAX_BODY_BYTES:
+                        keep_alive = False
+                        raise RequestError(413, "слишком большой запрос")
+                    body = await reader.readexactly(length) if length else b""
+                    self.stats["requests"] += 1
+                    status, payload = await self.dispatch(method, urlsplit(target).path, body)
+                except RequestError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except ValueError:
+                    status, payload, keep_alive = 400, {"error": "некорректный HTTP-запрос"}, False
+                except Exception as e:
+                    status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+                if status >= 400: self.stats["errors"] += 1
+                writer.write(_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive: break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+def _response(status, payload, keep_alive):
+    if isinstance(payload, str):
+        body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+    else:
+        body, content_type = json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8"
+    headers = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}", f"Content-Type: {content_type}",
+               f"Content-Length: {len(body)}", f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+    if status == 503: headers.append("Retry-After: 1")
+    return ("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + body
+
+# ======================================================================================
+# ЗАПУСК
+# ======================================================================================
+
+async def serve(host, port, **options):
+    service = CalculationService(**options)
+    server = await service.start(host, port)
+    # По SIGTERM останавливаемся так же, как по Ctrl+C: пул воркеров закрывается в finally
+    loop = asyncio.get_running_loop()
+    main_task = asyncio.current_task()
+    try:
+        loop.add_signal_handler(signal.SIGTERM, main_task.cancel)
+    except (NotImplementedError, AttributeError):
+        pass  # Windows
+    print(f"Сервис расчета слушает http://{host}:{port} (воркеров: {service.workers})", flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP-сервис расчета коммунальных платежей")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=None, help="процессов в пуле (0 - считать в потоке)")
+    parser.add_argument("--window-ms", type=float, default=2.0, help="окно сбора пачки, мс")
+    parser.add_argument("--max-batch", type=int, default=1024)
+    parser.add_argument("--queue-size", type=int, default=10_000, help="лимит очереди города")
+    parser.add_argument("--db", default=DB_FILE)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, workers=args.workers, window=args.window_ms / 1000,
+                          max_batch=args.max_batch, queue_size=args.queue_size, db_file=args.db))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,8 @@ import sqlite3
 import json
 import os
 
+from update_db_schema import migrate
+
 DB_FILE = "utilities.db"
 
 CITIES_DATA = {
@@ -11,6 +13,12 @@ CITIES_DATA = {
 }
 SERVICES = ["Электроэнергия", "Вода", "Канализация", "Отопление", "Фикс. платежи", "Интернет", "Телефон", "Содержание дома", "Аренда", "Газ", "IPTV"]
 
+def create_schema(cursor):
+    # Базовые таблицы; pipelines, периоды тарифов и индексы добавляют миграции update_db_schema.py
+    cursor.execute("CREATE TABLE cities (id INTEGER PRIMARY KEY, name TEXT UNIQUE, currency TEXT, volume_model TEXT, recommendations TEXT, heating_months TEXT)")
+    cursor.execute("CREATE TABLE services (id INTEGER PRIMARY KEY, name TEXT UNIQUE)")
+    cursor.execute("CREATE TABLE tariffs (id INTEGER PRIMARY KEY, city_id INTEGER, service_id INTEGER, vat REAL DEFAULT 0.0, params TEXT, pipeline TEXT, FOREIGN KEY (city_id) REFERENCES cities (id), FOREIGN KEY (service_id) REFERENCES services (id))")
+
 def setup_database():
     if os.path.exists(DB_FILE):
         os.remove(DB_FILE)
@@ -19,9 +27,7 @@ def setup_database():
     cursor = conn.cursor()
 
     # Создаем таблицы
-    cursor.execute("CREATE TABLE cities (id INTEGER PRIMARY KEY, name TEXT UNIQUE, currency TEXT, volume_model TEXT, recommendations TEXT, heating_months TEXT)")
-    cursor.execute("CREATE TABLE services (id INTEGER PRIMARY KEY, name TEXT UNIQUE)")
-    cursor.execute("CREATE TABLE tariffs (id INTEGER PRIMARY KEY, city_id INTEGER, service_id INTEGER, vat REAL DEFAULT 0.0, params TEXT, pipeline TEXT, FOREIGN KEY (city_id) REFERENCES cities (id), FOREIGN KEY (service_id) REFERENCES services (id))")
+    create_schema(cursor)
 
     # Наполняем города
     for name, data in CITIES_DATA.items():
@@ -35,6 +41,7 @@ def setup_database():
 
     conn.commit()
     conn.close()
+    migrate(DB_FILE)
     print(f"База данных '{DB_FILE}' успешно создана с базовой структурой.")
 
 if __name__ == "__main__":
@@ -1,33 +1,153 @@
 # streamlit_app.py
-# -- Версия с принудительным обновлением 
+# -- Версия с принудительным обновлением
 
-import streamlit as st
-import pandas as pd
+import sys
+import time
+
+_STARTED = time.perf_counter()
 
-# streamlit_app.py
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 
 # Импортируем данные и логику из наших модулей
 # Убедитесь, что файлы config.py и engine.py находятся в той же папке!
-from config import CITIES_DB, SCENARIOS, HOUSE_COEFS
-from engine import calculate_volumes, calculate_costs, apply_neighbor_adjustment
+from config import SCENARIOS, HOUSE_COEFS, get_provider
+from engine import calculate_volumes, calculate_costs, apply_neighbor_adjustment, calculate_annual_costs, trace_calculation
+from cost_grid import lookup_costs
+from result_cache import cached_costs
+from neighbor_simulation import simulate_neighbors, neighbor_percentiles, rank_among_neighbors
+from profiling import STATS
+
+_IMPORTED = time.perf_counter()
+
+# ======================================================================================
+# КЭШИРОВАНИЕ МЕЖДУ ПЕРЕРИСОВКАМИ
+# ======================================================================================
+# Streamlit выполняет скрипт заново при каждом изменении виджета, поэтому:
+#   - провайдер тарифов (и скомпилированные им конвейеры) - ресурс, один на процесс;
+#   - результаты расчета кэшируются по входным параметрам и версии тарифов города,
+#     так что правка тарифов в БД сама сбрасывает устаревшие записи;
+#   - графики кэшируются по своим данным, а plotly импортируется только при
+#     построении первого графика: метрики и таблицы отрисовываются раньше.
+# При включенном в сессии профилировании ее расчеты идут мимо кэшей, иначе замеры не увидят движок.
+# Время импорта модулей и первой отрисовки в процессе пишется в profiling.STATS
+# (вид "app") и в журнал сервера.
+
+NEIGHBOR_DRAWS = 50_000
+MONTH_NAMES = ["Янв", "Фев", "Мар", "Апр", "Май", "Июн", "Июл", "Авг", "Сен", "Окт", "Ноя", "Дек"]
+
+
+@st.cache_resource
+def load_provider():
+    return get_provider()
+
+
+@st.cache_resource
+def _startup_timings():
+    # Общий для всех сессий процесса: импорт и первая отрисовка бывают один раз
+    return {}
+
+
+def _calculation_params(area_m2, occupants, subsidy_multiplier):
+    return {"area_m2": area_m2, "occupants": occupants, "floor": 5, "subsidy_multiplier": subsidy_multiplier}
+
+
+def compute_month_costs(city, area_m2, occupants, month, scenario, house_category, subsidy_multiplier):
+    """(идеальный расчет, средний сосед) за месяц."""
+    behavior_factor = SCENARIOS[scenario]
+    calculation_params = _calculation_params(area_m2, occupants, subsidy_multiplier)
+    if STATS.enabled:
+        ideal_costs = calculate_costs(city, calculate_volumes(city, area_m2, occupants, month, 1.0), calculation_params)
+        neighbor_base = calculate_costs(city, calculate_volumes(city, area_m2, occupants, month, behavior_factor), calculation_params)
+        return ideal_costs, apply_neighbor_adjustment(neighbor_base, house_category)
+    # Сначала пробуем предрассчитанную сетку (cost_grid.py); если ее нет или она
+    # устарела относительно тарифов - считаем через движок с постоянным кэшем результатов.
+    grid_costs = lookup_costs(city, area_m2, occupants, month, scenario, house_category, subsidy_multiplier)
+    if grid_costs is not None:
+        return grid_costs
+    return (cached_costs(city, area_m2, occupants, month, 1.0, calculation_params),
+            cached_costs(city, area_m2, occupants, month, behavior_factor, calculation_params, house_category))
+
+
+def compute_annual_costs(city, area_m2, occupants, scenario, house_category, subsidy_multiplier):
+    return calculate_annual_costs(city, {**_calculation_params(area_m2, occupants, subsidy_multiplier),
+                                         "behavior_factor": SCENARIOS[scenario], "house_category": house_category})
+
+
+# tariff_version не используется в теле, но входит в ключ кэша
+@st.cache_data(max_entries=4096, show_spinner=False)
+def _cached_month_costs(city, area_m2, occupants, month, scenario, house_category, subsidy_multiplier, tariff_version):
+    return compute_month_costs(city, area_m2, occupants, month, scenario, house_category, subsidy_multiplier)
+
+
+@st.cache_data(max_entries=1024, show_spinner=False)
+def _cached_annual_costs(city, area_m2, occupants, scenario, house_category, subsidy_multiplier, tariff_version):
+    return compute_annual_costs(city, area_m2, occupants, scenario, house_category, subsidy_multiplier)
+
+
+def compute_neighbor_percentiles(city, month, subsidy_multiplier, area_m2=None, occupants=None):
+    """Перцентили 0..100 стоимостей смоделированных соседей; area_m2/occupants - только похожие."""
+    distributions = {}
+    if area_m2 is not None: distributions["area_m2"] = {"kind": "fixed", "value": area_m2}
+    if occupants is not None: distributions["occupants"] = {"kind": "fixed", "value": occupants}
+    costs = simulate_neighbors(city, month, {"floor": 5, "subsidy_multiplier": subsidy_multiplier},
+                               draws=NEIGHBOR_DRAWS, seed=0, distributions=distributions)
+    return neighbor_percentiles(costs)
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def _cached_neighbor_percentiles(city, month, subsidy_multiplier, area_m2, occupants, tariff_version):
+    return compute_neighbor_percentiles(city, month, subsidy_multiplier, area_m2, occupants)
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def comparison_figure(detail_df, currency_label):
+    import plotly.express as px
+    # Преобразуем данные для удобного построения графика в Plotly
+    plot_df = detail_df.melt(id_vars="Категория", var_name="Тип", value_name="Сумма")
+    fig = px.bar(plot_df, x="Категория", y="Сумма", color="Тип", barmode="group",
+                 color_discrete_map={
+                     f"Идеальный расчёт ({currency_label})": "#636EFA",
+                     f"Ваши реальные данные ({currency_label})": "#00CC96",
+                     f"Средний сосед ({currency_label})": "#EF553B"
+                 },
+                 text="Сумма")
+    fig.update_traces(texttemplate='%{text:.2f}', textposition='outside')
+    fig.update_layout(yaxis_title=f"{currency_label} / месяц", legend_title_text="Показатель", uniformtext_minsize=8)
+    return fig
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def yearly_figure(yearly_df, currency_label):
+    import plotly.express as px
+    fig = px.line(yearly_df.melt(id_vars="Месяц", var_name="Тип", value_name="Сумма"),
+                  x="Месяц", y="Сумма", color="Тип", markers=True,
+                  color_discrete_map={
+                      f"Идеальный расчёт ({currency_label})": "#636EFA",
+                      f"Средний сосед ({currency_label})": "#EF553B"
+                  })
+    fig.update_layout(yaxis_title=f"{currency_label} / месяц", legend_title_text="Показатель")
+    return fig
+
 
 st.set_page_config(page_title="Utility Benchmark — дашборд", page_icon="🏠", layout="wide")
 
+timings = _startup_timings()
+if "import" not in timings:
+    timings["import"] = _IMPORTED - _STARTED
+    STATS.record("app", ("import",), timings["import"])
+
 # --- Sidebar: параметры семьи ---
 st.sidebar.header("Параметры")
-city = st.sidebar.selectbox("Город", list(CITIES_DB.keys()))
-city_config = CITIES_DB[city]
+provider = load_provider()
+city = st.sidebar.selectbox("Город", provider.city_names())
+city_config = provider.city_config(city)
 currency_label = city_config["currency"]
 
-month = st.sidebar.selectbox("Месяц", list(range(1, 13)),
-                             format_func=lambda x: ["Янв", "Фев", "Мар", "Апр", "Май", "Июн", "Июл", "Авг", "Сен", "Окт", "Ноя", "Дек"][x-1])
+month = st.sidebar.selectbox("Месяц", list(range(1, 13)), format_func=lambda x: MONTH_NAMES[x-1])
 area_m2 = st.sidebar.number_input("Площадь, м²", 10.0, 500.0, 90.0)
 occupants = st.sidebar.number_input("Количество жильцов", 1, 20, 3)
 scenario = st.sidebar.selectbox("Сценарий поведения", list(SCENARIOS.keys()), index=1)
-behavior_factor = SCENARIOS[scenario]
 house_category = st.sidebar.selectbox("Категория дома", list(HOUSE_COEFS.keys()), index=1)
 
 subsidy_multiplier = 1.0
@@ -36,16 +156,21 @@ if city == "Минск":
     if not st.sidebar.checkbox("Использовать льготный тариф", value=True):
         subsidy_multiplier = 0.0
 
-# --- Универсальный блок расчетов ---
-calculation_params = {
-    "area_m2": area_m2, "occupants": occupants, "floor": 5, "subsidy_multiplier": subsidy_multiplier
-}
-ideal_volumes = calculate_volumes(city, area_m2, occupants, month, behavior_factor=1.0)
-ideal_costs = calculate_costs(city, ideal_volumes, calculation_params)
+# --- Отладка: замеры движка (profiling.py) ---
+# Флажок хранится в st.session_state этой сессии, а профилирование включается только в
+# потоке, который выполняет ее скрипт: другие посетители остаются на кэшированном пути.
+# По умолчанию - как у процесса (UTILITY_PROFILE=1).
+profiling_on = st.sidebar.checkbox("🛠 Профилирование движка", value=STATS.process_enabled, key="profiling_on")
+STATS.set_thread_enabled(profiling_on)
 
-neighbor_volumes = calculate_volumes(city, area_m2, occupants, month, behavior_factor)
-neighbor_base_costs = calculate_costs(city, neighbor_volumes, calculation_params)
-neighbor_costs = apply_neighbor_adjustment(neighbor_base_costs, house_category)
+# --- Универсальный блок расчетов ---
+calculation_params = _calculation_params(area_m2, occupants, subsidy_multiplier)
+if profiling_on:
+    ideal_costs, neighbor_costs = compute_month_costs(city, area_m2, occupants, month, scenario, house_category,
+                                                      subsidy_multiplier)
+else:
+    ideal_costs, neighbor_costs = _cached_month_costs(city, area_m2, occupants, month, scenario, house_category,
+                                                      subsidy_multiplier, provider.tariff_version(city))
 
 # --- Ввод реальных расходов ---
 st.header(f"📊 Введите ваши реальные расходы за месяц ({currency_label})")
@@ -54,7 +179,7 @@ extra_categories = ["Аренда"] if city == "Лимасол" else []
 
 with st.expander("Показать поля для ручного ввода"):
     user_real = {k: st.number_input(f"{k} {currency_label}", 0.0, value=0.0, step=0.1) for k in CATEGORIES + extra_categories}
-    
+
     # Исключаем доп. категории из "Итого"
     total_keys = [k for k in user_real.keys() if k not in extra_categories]
     user_real["Итого"] = round(sum(user_real[k] for k in total_keys), 2)
@@ -78,19 +203,7 @@ detail_df = pd.DataFrame({
 st.dataframe(detail_df, use_container_width=True)
 
 # --- График ---
-# Преобразуем данные для удобного построения графика в Plotly
-plot_df = detail_df.melt(id_vars="Категория", var_name="Тип", value_name="Сумма")
-
-fig = px.bar(plot_df, x="Категория", y="Сумма", color="Тип", barmode="group",
-             color_discrete_map={
-                 f"Идеальный расчёт ({currency_label})": "#636EFA",
-                 f"Ваши реальные данные ({currency_label})": "#00CC96",
-                 f"Средний сосед ({currency_label})": "#EF553B"
-             },
-             text="Сумма")
-fig.update_traces(texttemplate='%{text:.2f}', textposition='outside')
-fig.update_layout(yaxis_title=f"{currency_label} / месяц", legend_title_text="Показатель", uniformtext_minsize=8)
-st.plotly_chart(fig, use_container_width=True)
+st.plotly_chart(comparison_figure(detail_df, currency_label), use_container_width=True)
 
 # --- Умные рекомендации ---
 st.header("💡 Рекомендации")
@@ -106,20 +219,100 @@ for i, (cat, (emoji, tip)) in enumerate(recommendations.items()):
     ideal_val = ideal_costs.get(cat, 0)
     user_val = user_real.get(cat, 0)
     diff = user_val - ideal_val
-    
+
     if ideal_val > 0:
         percent_over = round(diff / ideal_val * 100, 1)
         msg = f"Перерасход {percent_over}% — {tip}" if diff > 1 else "Расход в норме"
     else:
         msg = f"Расход: {user_val:.2f}" if user_val > 0 else "Расход в норме"
-    
+
     with cols[i]:
         st.markdown(f"""
             <div style='padding:12px; border-radius:10px; background-color:{get_color(diff)};
-                        font-size:0.9em; text-align:center; min-height:150px; 
+                        font-size:0.9em; text-align:center; min-height:150px;
                         display: flex; flex-direction: column; justify-content: center;'>
                 <div style='font-size:1.5em'>{emoji}</div>
                 <strong>{cat}</strong>
                 <div style='margin-top:6px'>{msg}</div>
             </div>
         """, unsafe_allow_html=True)
+
+# --- Место среди соседей (neighbor_simulation.py) ---
+st.header(f"👥 Вы среди соседей ({currency_label})")
+similar_only = st.checkbox("Только похожие домохозяйства (та же площадь и число жильцов)")
+neighbor_args = (city, month, subsidy_multiplier, area_m2 if similar_only else None, occupants if similar_only else None)
+if profiling_on:
+    neighbor_table = compute_neighbor_percentiles(*neighbor_args)
+else:
+    neighbor_table = _cached_neighbor_percentiles(*neighbor_args, provider.tariff_version(city))
+
+# Сравниваем только заполненные пользователем услуги
+ranks = rank_among_neighbors(neighbor_table, {k: v for k, v in user_real.items() if v > 0})
+bands_df = neighbor_table.loc[[10, 50, 90]].T.rename(columns=lambda p: f"p{p}")
+bands_df["Ваши расходы"] = [user_real.get(c) or None for c in bands_df.index]
+bands_df["Перцентиль среди соседей"] = [round(ranks[c]) if c in ranks else None for c in bands_df.index]
+st.dataframe(bands_df.rename_axis("Категория"), use_container_width=True)
+if "Итого" in ranks:
+    st.info(f"Ваши расходы выше, чем примерно у {ranks['Итого']:.0f}% из {NEIGHBOR_DRAWS:,} смоделированных соседей.")
+else:
+    st.caption("Введите реальные расходы выше, чтобы увидеть свое место среди соседей.")
+
+# --- Годовой прогноз ---
+st.header(f"📅 Годовой прогноз ({currency_label})")
+if profiling_on:
+    annual = compute_annual_costs(city, area_m2, occupants, scenario, house_category, subsidy_multiplier)
+else:
+    annual = _cached_annual_costs(city, area_m2, occupants, scenario, house_category, subsidy_multiplier,
+                                  provider.tariff_version(city))
+col1, col2 = st.columns(2)
+with col1:
+    st.metric(f"Идеальный расчёт за год, {currency_label}", f"{annual['ideal_year'].get('Итого', 0):.2f}")
+with col2:
+    st.metric(f"Средний сосед за год, {currency_label}", f"{annual['neighbor_year'].get('Итого', 0):.2f}")
+
+yearly_df = pd.DataFrame({
+    "Месяц": MONTH_NAMES,
+    f"Идеальный расчёт ({currency_label})": [costs.get("Итого", 0) for costs in annual["ideal"]],
+    f"Средний сосед ({currency_label})": [costs.get("Итого", 0) for costs in annual["neighbor"]],
+})
+st.plotly_chart(yearly_figure(yearly_df, currency_label), use_container_width=True)
+
+with st.expander("Помесячная разбивка по услугам"):
+    st.dataframe(pd.DataFrame([{"Месяц": name, **costs} for name, costs in zip(MONTH_NAMES, annual["neighbor"])]),
+                 use_container_width=True)
+
+# --- Время запуска и перерисовки ---
+rerun_s = time.perf_counter() - _STARTED
+STATS.record("app", ("rerun",), rerun_s)
+if "first_paint" not in timings:
+    timings["first_paint"] = rerun_s
+    STATS.record("app", ("first_paint",), rerun_s)
+    print(f"streamlit_app: импорт модулей {timings['import'] * 1000:.0f} мс, "
+          f"первая отрисовка {rerun_s * 1000:.0f} мс", file=sys.stderr)
+
+# --- Отладка: профилирование движка ---
+if profiling_on:
+    st.header("🛠 Профилирование движка")
+    st.caption(f"Импорт модулей: {timings['import'] * 1000:.0f} мс, первая отрисовка: "
+               f"{timings['first_paint'] * 1000:.0f} мс, эта перерисовка: {rerun_s * 1000:.0f} мс")
+    if st.button("Сбросить замеры"):
+        STATS.reset()
+    stats_df = pd.DataFrame(STATS.snapshot())
+    if not stats_df.empty:
+        stats_df["mean_s"] *= 1e6; stats_df["max_s"] *= 1e6
+        stats_df = stats_df.rename(columns={"mean_s": "среднее, мкс", "max_s": "максимум, мкс", "total_s": "всего, с"})
+    st.dataframe(stats_df, use_container_width=True)
+
+    with st.expander("Метрики в формате Prometheus"):
+        st.code(STATS.prometheus_text(), language="text")
+
+    with st.expander("Пошаговая трассировка идеального расчета"):
+        trace = trace_calculation(city, area_m2, occupants, month, 1.0, calculation_params)
+        st.write("Объемы:", trace["volumes"])
+        st.dataframe(pd.DataFrame([{"Услуга": service, **step}
+                                   for service, service_trace in trace["services"].items()
+                                   for step in service_trace["steps"]]), use_container_width=True)
+        mismatched = [service for service, service_trace in trace["services"].items()
+                      if service_trace["result"] != service_trace["compiled"]]
+        if mismatched:
+            st.error(f"Скомпилированный конвейер расходится с интерпретатором: {', '.join(mismatched)}")
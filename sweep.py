@@ -0,0 +1,228 @@
+# sweep.py
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from config import SCENARIOS, HOUSE_COEFS, get_provider
+from config_provider import TariffConfigProvider
+from db_connector import DB_FILE
+from batch_engine import calculate_costs_batch, apply_neighbor_adjustment_batch
+
+# ======================================================================================
+# МНОГОПРОЦЕССНЫЙ ПРОГОН СЦЕНАРИЕВ
+# ======================================================================================
+# Перебирает города × месяцы × жильцов × площади × SCENARIOS × HOUSE_COEFS и считает
+# стоимость "среднего соседа" (calculate_volumes -> calculate_costs -> apply_neighbor_adjustment)
+# пакетным движком. Сетка параметров не передается в процессы: задача - это только
+# (город, начало, конец) в плоской нумерации сетки, воркер сам восстанавливает параметры
+# через np.unravel_index. Конфигурация тарифов загружается в каждом воркере один раз
+# при старте (initializer), TARIFFS_DB между процессами не пересылается.
+# Результаты пишутся в CSV/Parquet строго в порядке сетки, независимо от числа процессов.
+#
+# Пример:
+#   python sweep.py --out sweep.csv --occupants 1-6 --areas 20:200:10 --workers 8
+
+PARAM_COLUMNS = ["city", "month", "occupants", "area_m2", "scenario", "house_category"]
+
+_WORKER_STATE = {}
+
+
+def build_axes(cities, months, occupants, areas, scenarios=None, house_categories=None):
+    return {
+        "cities": list(cities),
+        "months": list(months),
+        "occupants": list(occupants),
+        "areas": list(areas),
+        "scenarios": list(scenarios or SCENARIOS.keys()),
+        "house_categories": list(house_categories or HOUSE_COEFS.keys()),
+    }
+
+def _city_shape(axes):
+    return tuple(len(axes[key]) for key in ("months", "occupants", "areas", "scenarios", "house_categories"))
+
+def iter_chunks(axes, chunk_size):
+    """Задачи (индекс города, начало, конец) в детерминированном порядке."""
+    rows_per_city = int(np.prod(_city_shape(axes)))
+    for city_index in range(len(axes["cities"])):
+        for start in range(0, rows_per_city, chunk_size):
+            yield city_index, start, min(start + chunk_size, rows_per_city)
+
+# ======================================================================================
+# ВОРКЕР
+# ======================================================================================
+
+def _init_worker(db_file, axes, services, output_format):
+    _WORKER_STATE["provider"] = TariffConfigProvider(db_file)
+    _WORKER_STATE["axes"] = axes
+    _WORKER_STATE["services"] = services
+    _WORKER_STATE["format"] = output_format
+
+def compute_chunk(task):
+    city_index, start, stop = task
+    axes, provider = _WORKER_STATE["axes"], _WORKER_STATE["provider"]
+    city = axes["cities"][city_index]
+
+    m, o, a, s, h = np.unravel_index(np.arange(start, stop), _city_shape(axes))
+    scenarios = np.array(axes["scenarios"], dtype=object)[s]
+    house_categories = np.array(axes["house_categories"], dtype=object)[h]
+    frame = pd.DataFrame({
+        "area_m2": np.asarray(axes["areas"], dtype=float)[a],
+        "occupants": np.asarray(axes["occupants"])[o],
+        "floor": 5,
+        "subsidy_multiplier": 1.0,
+        "month": np.asarray(axes["months"])[m],
+        "behavior_factor": np.array([SCENARIOS[name] for name in axes["scenarios"]])[s],
+    })
+    costs = calculate_costs_batch(city, frame, provider=provider)
+    neighbor_costs = apply_neighbor_adjustment_batch(costs, house_categories)
+
+    result = pd.DataFrame({
+        "city": city, "month": frame["month"], "occupants": frame["occupants"], "area_m2": frame["area_m2"],
+        "scenario": scenarios, "house_category": house_categories,
+    })
+    # Единый набор колонок для всех городов: услуги, которых в городе нет, остаются пустыми
+    for service in _WORKER_STATE["services"]:
+        result[service] = neighbor_costs[service] if service in neighbor_costs else np.nan
+    if _WORKER_STATE["format"] == "csv":
+        # Сериализуем в воркере, чтобы основной процесс только дописывал байты в файл
+        return len(result), result.to_csv(header=False, index=False)
+    return len(result), result
+
+# ======================================================================================
+# ЗАПИСЬ РЕЗУЛЬТАТОВ
+# ======================================================================================
+
+class _CsvSink:
+    def __init__(self, path, columns):
+        self._file = open(path, "w", encoding="utf-8", newline="")
+        self._file.write(pd.DataFrame(columns=columns).to_csv(index=False))
+
+    def write(self, payload):
+        self._file.write(payload)
+
+    def close(self):
+        self._file.close()
+
+class _ParquetSink:
+    def __init__(self, path, columns):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Для записи в Parquet установите pyarrow или используйте .csv")
+        self._pa, self._pq = pyarrow, pyarrow.parquet
+        self._path = path
+        self._writer = None
+
+    def write(self, payload):
+        table = self._pa.Table.from_pandas(payload, preserve_index=False)
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(self._path, table.schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+def _ordered_results(executor, tasks, max_in_flight):
+    # Как executor.map, но держит в работе не больше max_in_flight задач:
+    # память ограничена даже для очень больших сеток, порядок результатов сохраняется.
+    pending = deque()
+    for task in tasks:
+        pending.append(executor.submit(compute_chunk, task))
+        if len(pending) >= max_in_flight:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+# ======================================================================================
+# ЗАПУСК
+# ======================================================================================
+
+def _provider_for(db_file):
+    return get_provider() if db_file == DB_FILE else TariffConfigProvider(db_file)
+
+def run_sweep(axes, out_path, workers=None, chunk_size=50_000, db_file=DB_FILE, progress=True):
+    output_format = "parquet" if out_path.endswith(".parquet") else "csv"
+    provider = _provider_for(db_file)
+    services = []
+    for city in axes["cities"]:
+        services += [s for s in provider.tariffs(city) if s not in services]
+    services.append("Итого")
+    columns = PARAM_COLUMNS + services
+
+    total_rows = len(axes["cities"]) * int(np.prod(_city_shape(axes)))
+    workers = workers or os.cpu_count() or 1
+    init_args = (db_file, axes, services, output_format)
+    sink = _CsvSink(out_path, columns) if output_format == "csv" else _ParquetSink(out_path, columns)
+
+    started = time.perf_counter(); done = 0
+    executor = None
+    try:
+        if workers == 1:
+            _init_worker(*init_args)
+            results = map(compute_chunk, iter_chunks(axes, chunk_size))
+        else:
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=init_args)
+            results = _ordered_results(executor, iter_chunks(axes, chunk_size), workers * 4)
+        for rows, payload in results:
+            sink.write(payload)
+            done += rows
+            if progress:
+                elapsed = time.perf_counter() - started
+                print(f"\r{done}/{total_rows} строк ({done / total_rows:.0%}), {done / elapsed:,.0f} строк/с",
+                      end="", file=sys.stderr, flush=True)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        sink.close()
+    elapsed = time.perf_counter() - started
+    if progress:
+        print(f"\nГотово: {done} строк за {elapsed:.2f} с -> {out_path}", file=sys.stderr)
+    return done, elapsed
+
+
+def _parse_int_range(text):
+    # "1-12" -> [1..12], "1,3,5" -> [1, 3, 5]
+    values = []
+    for part in text.split(","):
+        if "-" in part:
+            low, high = part.split("-")
+            values += list(range(int(low), int(high) + 1))
+        else:
+            values.append(int(part))
+    return values
+
+def _parse_float_range(text):
+    # "20:200:10" -> 20, 30, ..., 200 (включительно); "45,60.5" -> [45.0, 60.5]
+    if ":" in text:
+        low, high, step = (float(x) for x in text.split(":"))
+        return np.round(np.arange(low, high + step / 2, step), 6).tolist()
+    return [float(x) for x in text.split(",")]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Прогон сценариев по сетке параметров")
+    parser.add_argument("--out", required=True, help="файл результата (.csv или .parquet)")
+    parser.add_argument("--cities", nargs="*", help="города (по умолчанию все из БД)")
+    parser.add_argument("--months", default="1-12")
+    parser.add_argument("--occupants", default="1-6")
+    parser.add_argument("--areas", default="20:200:10", help="min:max:step или список через запятую")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    parser.add_argument("--db", default=DB_FILE)
+    args = parser.parse_args(argv)
+
+    provider = _provider_for(args.db)
+    axes = build_axes(args.cities or provider.city_names(), _parse_int_range(args.months),
+                      _parse_int_range(args.occupants), _parse_float_range(args.areas))
+    run_sweep(axes, args.out, workers=args.workers, chunk_size=args.chunk_size, db_file=args.db)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# tests/test_engine_equivalence.py
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from batch_engine import calculate_costs_batch, round_money
+from config_provider import TariffConfigProvider
+from engine import _execute_pipeline, calculate_costs, calculate_volumes
+
+# ======================================================================================
+# ЭКВИВАЛЕНТНОСТЬ ИНТЕРПРЕТАТОРА, СКОМПИЛИРОВАННЫХ КОНВЕЙЕРОВ И ПАКЕТНОГО РАСЧЕТА
+# ======================================================================================
+# Для каждого города из utilities.db на случайных домохозяйствах сравниваются:
+# эталонный _execute_pipeline, engine.calculate_costs и batch_engine.calculate_costs_batch.
+# Результаты должны совпадать до копейки.
+
+HOUSEHOLDS = 300
+
+
+@pytest.fixture(scope="module")
+def provider():
+    provider = TariffConfigProvider()
+    yield provider
+    provider.close()
+
+
+def _households(seed):
+    rng = random.Random(seed)
+    return pd.DataFrame([{
+        "area_m2": round(rng.uniform(15.0, 250.0), rng.choice([0, 1, 2])),
+        "occupants": rng.randint(1, 8),
+        "month": rng.randint(1, 12),
+        "behavior_factor": rng.choice([1.0, 0.85, 1.25, round(rng.uniform(0.5, 2.0), 3)]),
+        "floor": rng.randint(1, 25),
+        "subsidy_multiplier": rng.choice([0.0, 1.0, round(rng.random(), 2)]),
+    } for _ in range(HOUSEHOLDS)])
+
+
+def _interpreted_costs(tariffs, volumes, calculation_params):
+    costs = {service: round(_execute_pipeline(rule.get("pipeline", []), rule, volumes, calculation_params), 2)
+             for service, rule in tariffs.items()}
+    costs["Итого"] = round(sum(v for k, v in costs.items() if k != "Итого"), 2)
+    return costs
+
+
+def test_cities_exist(provider):
+    assert provider.city_names()
+
+
+def test_interpreter_compiled_and_batch_agree(provider):
+    for seed, city in enumerate(provider.city_names()):
+        tariffs = provider.tariffs(city)
+        frame = _households(seed)
+        batch = calculate_costs_batch(city, frame, provider=provider)
+        for i, household in enumerate(frame.to_dict("records")):
+            volumes = calculate_volumes(city, household["area_m2"], household["occupants"], household["month"],
+                                        household["behavior_factor"], provider)
+            expected = _interpreted_costs(tariffs, volumes, household)
+            assert calculate_costs(city, volumes, household, provider) == expected, (city, household)
+            assert batch.iloc[i].to_dict() == expected, (city, household)
+
+
+def test_round_money_matches_round():
+    rng = np.random.default_rng(0)
+    # Случайные суммы и значения ровно на середине между копейками (N.xx5)
+    values = np.concatenate([rng.uniform(0, 10_000, 50_000),
+                             rng.integers(0, 1_000_000, 50_000) / 1000 + 0.005,
+                             -rng.uniform(0, 1_000, 1_000)])
+    assert round_money(values).tolist() == [round(float(x), 2) for x in values]
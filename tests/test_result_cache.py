@@ -0,0 +1,38 @@
+# tests/test_result_cache.py
+import json
+import os
+import subprocess
+import sys
+
+# ======================================================================================
+# ОБЩИЙ SQLITE-УРОВЕНЬ КЭША МЕЖДУ ПРОЦЕССАМИ
+# ======================================================================================
+# Запись, сделанная одним процессом, должна находиться в другом (воркеры Streamlit,
+# перезапуски): ключ и версия движка не должны зависеть от процесса.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = """
+import json, sys
+from result_cache import ENGINE_VERSION, ResultCache, cached_costs
+cache = ResultCache(db_file=sys.argv[1])
+costs = cached_costs("Минск", 60.0, 2, 1, 1.0, {"floor": 5, "subsidy_multiplier": 1.0}, "Средний", cache=cache)
+removed = cache.prune()
+cache.close()
+print(json.dumps({"version": ENGINE_VERSION, "costs": costs, "stats": cache.stats, "removed": removed}))
+"""
+
+
+def _run(db_file):
+    result = subprocess.run([sys.executable, "-c", SCRIPT, db_file], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_entry_written_in_one_process_is_read_in_another(tmp_path):
+    db_file = str(tmp_path / "results_cache.db")
+    first, second = _run(db_file), _run(db_file)
+    assert first["stats"]["misses"] == 1 and first["stats"]["writes"] == 1
+    assert second["version"] == first["version"]
+    assert second["stats"]["disk_hits"] == 1 and second["stats"]["misses"] == 0
+    assert second["removed"] == 0
+    assert second["costs"] == first["costs"]
@@ -0,0 +1,78 @@
+# tests/test_service.py
+import asyncio
+import json
+
+import service
+from service import CalculationService
+
+# ======================================================================================
+# HTTP-СЕРВИС: ПРОВЕРКА ЗАПРОСОВ И ИЗОЛЯЦИЯ ОШИБОК В ПАЧКЕ
+# ======================================================================================
+# Сервис поднимается на свободном порту с workers=0 (расчет в потоке) и получает
+# настоящие HTTP-запросы.
+
+HOUSEHOLD = {"city": "Минск", "area_m2": 60.0, "occupants": 2, "month": 1}
+
+
+async def _post(port, path, payload):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+    writer.write(f"POST {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1")
+                 + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    # Ответ обязан быть строгим JSON: без токенов NaN/Infinity
+    return int(head.split()[1]), json.loads(body, parse_constant=lambda token: 1 / 0)
+
+
+def _serve(requests, **options):
+    async def run():
+        calculation_service = CalculationService(workers=0, **options)
+        server = await calculation_service.start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            responses = await asyncio.gather(*(_post(port, path, payload) for path, payload in requests))
+        finally:
+            server.close()
+            calculation_service.close()
+        return responses, calculation_service.stats
+    return asyncio.run(run())
+
+
+def test_valid_request():
+    [(status, body)], _ = _serve([("/costs", HOUSEHOLD)])
+    assert status == 200 and body["costs"]["Итого"] > 0
+
+
+def test_non_integral_occupants_rejected():
+    responses, _ = _serve([("/costs", {**HOUSEHOLD, "occupants": 2.7}), ("/costs", {**HOUSEHOLD, "month": 1.5}),
+                           ("/costs", {**HOUSEHOLD, "occupants": 2.0})])
+    assert [status for status, _ in responses] == [400, 400, 200]
+
+
+def test_non_finite_numbers_rejected():
+    requests = [("/costs", {**HOUSEHOLD, field: value})
+                for field in ("area_m2", "behavior_factor", "subsidy_multiplier") for value in ("nan", "inf", "-inf")]
+    # json.dumps отправляет float("nan") и float("inf") токенами NaN и Infinity
+    requests.append(("/costs", {**HOUSEHOLD, "area_m2": float("nan")}))
+    requests.append(("/neighbor_adjustment", {"costs": {"Вода": float("inf")}, "house_category": "Новый"}))
+    responses, _ = _serve(requests)
+    assert [status for status, _ in responses] == [400] * len(requests)
+
+
+def test_bad_request_does_not_fail_its_batch(monkeypatch):
+    evaluate_batch = service.evaluate_batch
+
+    def failing_evaluate_batch(city, columns, house_categories, need_costs):
+        # Пачка с "плохим" домохозяйством падает целиком
+        if 13.0 in columns["area_m2"]:
+            raise RuntimeError("ошибка расчета")
+        return evaluate_batch(city, columns, house_categories, need_costs)
+
+    monkeypatch.setattr(service, "evaluate_batch", failing_evaluate_batch)
+    areas = [40.0, 13.0, 55.0, 70.0]
+    responses, stats = _serve([("/costs", {**HOUSEHOLD, "area_m2": area}) for area in areas], window=0.2)
+    assert stats["batches"] >= 1 and stats["failed_batches"] == 1
+    assert [status for status, _ in responses] == [200, 500, 200, 200]
@@ -1,38 +1,112 @@
 # update_db_schema.py
 import sqlite3
 import json
+import sys
 
 DB_FILE = "utilities.db"
-print(f"Начинаем обновление схемы для '{DB_FILE}'...")
 
-conn = sqlite3.connect(DB_FILE)
-cursor = conn.cursor()
+# ======================================================================================
+# ВЕРСИОНИРУЕМЫЕ МИГРАЦИИ СХЕМЫ
+# ======================================================================================
+# Номер последней примененной миграции хранится в PRAGMA user_version. Запуск скрипта
+# применяет только недостающие миграции, каждую в своей транзакции: при ошибке
+# база остается в предыдущей версии. Новая миграция - это новая функция в конце MIGRATIONS.
+#
+#   python update_db_schema.py [путь к БД]
 
-try:
+
+def _migration_1_heating_months(cursor):
     # 1. Добавляем новую колонку 'heating_months' в таблицу 'cities'
-    cursor.execute("ALTER TABLE cities ADD COLUMN heating_months TEXT")
-    print("Колонка 'heating_months' успешно добавлена в таблицу 'cities'.")
-except sqlite3.OperationalError as e:
-    if "duplicate column name" in str(e):
-        print("Колонка 'heating_months' уже существует. Пропускаем...")
-    else:
-        raise e
-
-# 2. Заполняем данными эту колонку для Минска
-heating_months_for_minsk = json.dumps([1, 2, 3, 4, 10, 11, 12])
-cursor.execute(
-    "UPDATE cities SET heating_months = ? WHERE name = ?",
-    (heating_months_for_minsk, "Минск")
-)
-print("Данные по отопительному сезону для Минска обновлены.")
-
-# 3. Заполняем пустыми данными для других городов, чтобы избежать ошибок
-cursor.execute(
-    "UPDATE cities SET heating_months = '[]' WHERE heating_months IS NULL"
-)
-print("Пустые данные по отопительному сезону добавлены для остальных городов.")
-
-conn.commit()
-conn.close()
-
-print("\nОбновление схемы базы данных успешно завершено!")
\ No newline at end of file
+    try:
+        cursor.execute("ALTER TABLE cities ADD COLUMN heating_months TEXT")
+        print("Колонка 'heating_months' успешно добавлена в таблицу 'cities'.")
+    except sqlite3.OperationalError as e:
+        if "duplicate column name" in str(e):
+            print("Колонка 'heating_months' уже существует. Пропускаем...")
+        else:
+            raise e
+
+    # 2. Заполняем данными эту колонку для Минска
+    heating_months_for_minsk = json.dumps([1, 2, 3, 4, 10, 11, 12])
+    cursor.execute(
+        "UPDATE cities SET heating_months = ? WHERE name = ?",
+        (heating_months_for_minsk, "Минск")
+    )
+    print("Данные по отопительному сезону для Минска обновлены.")
+
+    # 3. Заполняем пустыми данными для других городов, чтобы избежать ошибок
+    cursor.execute(
+        "UPDATE cities SET heating_months = '[]' WHERE heating_months IS NULL"
+    )
+    print("Пустые данные по отопительному сезону добавлены для остальных городов.")
+
+
+def _migration_2_pipelines_periods_indexes(cursor):
+    # 1. Конвейеры - в отдельную таблицу: у многих тарифов они одинаковые
+    # ("фиксированная сумма + НДС"), и каждый хранится и разбирается один раз.
+    # Текст приводится к json.dumps(...) по умолчанию - так же пишет bulk_import.py.
+    cursor.execute("CREATE TABLE pipelines (id INTEGER PRIMARY KEY, definition TEXT NOT NULL UNIQUE)")
+    definitions = {}
+    for tariff_id, pipeline in cursor.execute("SELECT id, pipeline FROM tariffs").fetchall():
+        definitions[tariff_id] = json.dumps(json.loads(pipeline or "[]"))
+    cursor.executemany("INSERT OR IGNORE INTO pipelines (definition) VALUES (?)",
+                       [(definition,) for definition in definitions.values()])
+    pipeline_ids = {definition: pipeline_id for pipeline_id, definition in cursor.execute("SELECT id, definition FROM pipelines")}
+    print(f"Конвейеры вынесены в таблицу 'pipelines': {len(definitions)} тарифов, {len(pipeline_ids)} уникальных.")
+
+    # 2. Пересобираем tariffs: pipeline_id вместо текста и период действия.
+    # valid_from включительно, valid_to не включительно (даты 'ГГГГ-ММ-ДД'), NULL - без ограничения.
+    cursor.execute("CREATE TABLE tariffs_new (id INTEGER PRIMARY KEY, city_id INTEGER NOT NULL, service_id INTEGER NOT NULL, "
+                   "vat REAL DEFAULT 0.0, params TEXT, pipeline_id INTEGER NOT NULL, valid_from TEXT, valid_to TEXT, "
+                   "FOREIGN KEY (city_id) REFERENCES cities (id), FOREIGN KEY (service_id) REFERENCES services (id), "
+                   "FOREIGN KEY (pipeline_id) REFERENCES pipelines (id))")
+    rows = cursor.execute("SELECT id, city_id, service_id, vat, params FROM tariffs").fetchall()
+    cursor.executemany("INSERT INTO tariffs_new (id, city_id, service_id, vat, params, pipeline_id) VALUES (?, ?, ?, ?, ?, ?)",
+                       [row + (pipeline_ids[definitions[row[0]]],) for row in rows])
+    cursor.execute("DROP TABLE tariffs")
+    cursor.execute("ALTER TABLE tariffs_new RENAME TO tariffs")
+    print("Таблица 'tariffs' пересобрана: добавлены pipeline_id, valid_from, valid_to.")
+
+    # 3. Индексы для погородной загрузки и поиска по услуге
+    cursor.execute("CREATE INDEX idx_tariffs_city_service ON tariffs (city_id, service_id, valid_from)")
+    cursor.execute("CREATE INDEX idx_tariffs_service ON tariffs (service_id)")
+    cursor.execute("CREATE INDEX idx_tariffs_pipeline ON tariffs (pipeline_id)")
+    print("Индексы по city_id, service_id и pipeline_id созданы.")
+
+
+MIGRATIONS = [
+    _migration_1_heating_months,
+    _migration_2_pipelines_periods_indexes,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(db_file=DB_FILE):
+    """Применяет недостающие миграции; возвращает итоговую версию схемы."""
+    conn = sqlite3.connect(db_file, isolation_level=None)
+    try:
+        version = schema_version(conn)
+        for number in range(version + 1, SCHEMA_VERSION + 1):
+            print(f"Миграция {number}: {MIGRATIONS[number - 1].__name__}")
+            conn.execute("BEGIN")
+            try:
+                MIGRATIONS[number - 1](conn.cursor())
+                conn.execute(f"PRAGMA user_version = {number}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return schema_version(conn)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    db_file = sys.argv[1] if len(sys.argv) > 1 else DB_FILE
+    print(f"Начинаем обновление схемы для '{db_file}'...")
+    version = migrate(db_file)
+    print(f"\nОбновление схемы базы данных успешно завершено! Версия схемы: {version}")